@@ -1,8 +1,169 @@
+import concurrent.futures
+import copy
+import itertools
 import math
+import multiprocessing
 import random
 import time
 
+import endgame
+import evaluate
 import game
+import mcts
+import othello
+
+# Parallel root search: the root moves are searched by a pool of worker processes. Every
+# worker keeps its own copy of the agent and shares with the others the best root value found
+# so far and the index (in move order) of the move that has it, and uses the value as its
+# alpha (or beta) bound. Ties are broken by move order exactly like in the sequential search:
+# a move that comes before the best move gets the bound loosened by TIE_MARGIN, so that an
+# equal value is still exact, and the others get the bound itself, like in search_root.
+# Before the root moves are handed out, every worker gets the move ordering tables (TT,
+# killers, history) of the main search, filled by the previous iterations, so the workers order
+# their moves as well as the sequential search. Workers keep their TT between searches, so only
+# the TT entries added since the previous search are sent. Every task returns what it added to
+# the TT and the history, so that the main search can use it next time.
+# A worker also checks the shared bound every 256 nodes and, when another worker improved it,
+# restarts its search with the tighter window. Restarting is cheap because the TT keeps the
+# best moves the interrupted search found, and unlike narrowing the window in the middle of
+# the tree it never stores (with PVS) a bound computed with a different window.
+TIE_MARGIN = 0.5
+
+# raised inside a worker's search when the shared root bound got tighter than its window
+class BoundImproved(Exception):
+    pass
+
+_worker_agent = None
+_worker_bound = None
+_worker_barrier = None
+
+def _init_worker(agent, bound, barrier):
+    global _worker_agent, _worker_bound, _worker_barrier
+    _worker_agent = agent
+    _worker_bound = bound
+    _worker_barrier = barrier
+
+def _minimax_root_move(state, depth, maximizing_player):
+    _worker_agent.reset_stats()
+    value = _worker_agent.minimax(state, depth, maximizing_player)
+    return value, _worker_agent.nodes
+
+# Gives a worker the ordering tables of the main search at the start of a parallel search:
+# the new TT entries, and the whole (small) history and killer tables. One of these tasks is
+# submitted per worker, and the barrier keeps every worker on its own until all of them
+# have one, so each worker loads the tables exactly once.
+def _load_tables(tt_entries, history, killers):
+    agent = _worker_agent
+    agent.new_search()
+    agent.tt.update(tt_entries)
+    agent.history = history
+    agent.killers = killers
+    _worker_barrier.wait()
+
+# 'state' is the position after the root move, 'maximizing_player' refers to the root player.
+# Returns the value, the number of nodes, the TT entries the search stored and the history
+# increments.
+def _alphabeta_root_move(state, depth, maximizing_player, index):
+    agent = _worker_agent
+    agent.reset_stats()
+    agent.tt_changes = {}
+    history_start = dict(agent.history)
+    agent.shared_bound = _worker_bound
+    agent.root_maximizing = maximizing_player
+    while True:
+        with _worker_bound.get_lock():
+            agent.search_bound, best_index = _worker_bound[0], _worker_bound[1]
+        margin = TIE_MARGIN if index < best_index else 0
+        try:
+            if maximizing_player:
+                alpha = agent.search_bound - margin
+                value = agent.alphabeta(state, depth, False, alpha, float('inf'), 1)
+                exact = value > alpha
+            else:
+                beta = agent.search_bound + margin
+                value = agent.alphabeta(state, depth, True, float('-inf'), beta, 1)
+                exact = value < beta
+            break
+        except BoundImproved:
+            # search again with the new bound
+            pass
+    agent.shared_bound = None
+    with _worker_bound.get_lock():
+        bound = _worker_bound[0]
+        better = value > bound if maximizing_player else value < bound
+        if better or (exact and value == bound and index < _worker_bound[1]):
+            _worker_bound[0] = value
+            _worker_bound[1] = index
+    tt_entries = agent.tt_changes
+    agent.tt_changes = None
+    history_increments = {key: count - history_start.get(key, 0) for key, count in agent.history.items()
+                          if count != history_start.get(key, 0)}
+    return value, agent.nodes, tt_entries, history_increments
+
+# Pondering: a background process searches a position the agent expects to reach after the
+# opponent's reply, until it is searched to 'max_depth' or 'stop' is set. It starts from the
+# agent's TT and sends back the TT entries it changed and the result of its last iteration.
+def _ponder(agent, state, max_depth, stop, conn):
+    base_tt = agent.tt
+    agent.tt = dict(base_tt)
+    agent.stop = stop
+    agent.new_search()
+    maximizing_player = state.nextPlayerToMove == othello.PLAYER1
+    best_move = None
+    best_value = None
+    completed_depth = 0
+    try:
+        for depth in range(1, max_depth + 1):
+            best_move, best_value = agent.search_iteration(state, depth, maximizing_player, best_value)
+            completed_depth = depth
+            if len(agent.tt) > agent.TT_SIZE:
+                break
+    except game.SearchTimeout:
+        pass
+    tt = {key: move for key, move in agent.tt.items() if base_tt.get(key) != move}
+    conn.send((state.key(), completed_depth, best_move, best_value, tt, agent.bounds, agent.history, agent.nodes))
+    conn.close()
+
+class ParallelPlayer(game.Player):
+    # Base class for the search agents that can spread their root moves over 'workers' processes
+
+    def __init__(self, workers=None):
+        super().__init__()
+        self.workers = workers
+        self.pool = None
+        self.bound = None
+        self.barrier = None
+
+    def get_pool(self):
+        if self.pool == None:
+            # best root value and index of its move
+            self.bound = multiprocessing.Array('d', 2)
+            self.barrier = multiprocessing.Barrier(self.workers)
+            self.pool = concurrent.futures.ProcessPoolExecutor(
+                self.workers, initializer=_init_worker, initargs=(self.worker_copy(), self.bound, self.barrier))
+        return self.pool
+
+    # Copy of this agent that is sent to the worker processes
+    def worker_copy(self):
+        worker = copy.copy(self)
+        worker.workers = None
+        worker.pool = None
+        worker.bound = None
+        worker.barrier = None
+        return worker
+
+    def close(self):
+        if self.pool != None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __getstate__(self):
+        # the pool only lives in the process that created it
+        state = self.__dict__.copy()
+        state['pool'] = None
+        state['bound'] = None
+        state['barrier'] = None
+        return state
 
 class HumanPlayer(game.Player):
 
@@ -31,84 +192,598 @@ class RandomAgent(game.Player):
         else:
             return None  # Or return a pass move.
 
-class MinimaxAgent(game.Player):
-    def __init__(self, depth):
-        super().__init__()
+class MinimaxAgent(ParallelPlayer):
+    def __init__(self, depth, workers=None, evaluator=None):
+        super().__init__(workers)
         self.depth = depth
+        # leaf evaluation function, see evaluate.py
+        self.evaluator = evaluate.get(evaluator)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.nodes = 0
 
     def choose_move(self, state):
         # Generate the list of moves
+        self.reset_stats()
+        maximizing_player = state.nextPlayerToMove == othello.PLAYER1
+        moves = state.generateMoves()
 
-        best_move = None
-        best_value = float('-inf')
+        if self.workers and len(moves) > 1:
+            pool = self.get_pool()
+            futures = [pool.submit(_minimax_root_move, state.applyMoveCloning(move), self.depth - 1, not maximizing_player)
+                       for move in moves]
+            values = []
+            for future in futures:
+                value, nodes = future.result()
+                values.append(value)
+                self.nodes += nodes
+        else:
+            values = [self.minimax(state.applyMoveCloning(move), self.depth - 1, not maximizing_player)
+                      for move in moves]
 
-        moves = state.generateMoves()
-        for move in moves:
-            next_state = state.applyMoveCloning(move)
-            value = self.minimax(next_state, self.depth - 1, False)
-            if value > best_value:
+        # the first move with the best value
+        best_move = None
+        best_value = float('-inf') if maximizing_player else float('inf')
+        for move, value in zip(moves, values):
+            if (value > best_value) if maximizing_player else (value < best_value):
                 best_value = value
                 best_move = move
 
         return best_move
 
     def minimax(self, state, depth, maximizing_player):
-
+        self.nodes += 1
         if depth == 0 or state.game_over():
-            return state.score()
+            return self.evaluator(state)
+
+        moves = state.generateMoves()
+        if not moves:
+            # the player to move has to pass
+            return self.minimax(state.passCloning(), depth - 1, not maximizing_player)
 
         if maximizing_player:
             best_value = float('-inf')
-            for move in state.generateMoves():
+            for move in moves:
                 next_state = state.applyMoveCloning(move)
                 best_value = max(best_value, self.minimax(next_state, depth - 1, False))
             return best_value
         else:
             best_value = float('inf')
-            for move in state.generateMoves():
+            for move in moves:
                 next_state = state.applyMoveCloning(move)
                 best_value = min(best_value, self.minimax(next_state, depth - 1, True))
             return best_value
 
-class AlphaBeta(game.Player):
-    def __init__(self, depth):
-        super().__init__()
+class AlphaBeta(ParallelPlayer):
+    # Moves are searched in this order: the best move found for the position by a previous
+    # iteration (kept in the transposition table), then corners and good squares according
+    # to the static square weights, then the killer moves of the current ply, and finally
+    # by the history heuristic. Good ordering makes most cutoffs happen on the first move.
+    # With 'workers' set, the last iteration searches the root moves in parallel.
+    # With 'endgame_empties' or fewer empty squares left, the game is solved exactly instead,
+    # and positions found in the opening 'book' (a book.OpeningBook) are not searched at all.
+    # When the game is played with pondering, the positions after the opponent's most likely
+    # replies are searched in the background while the opponent thinks; if one of them is
+    # reached, the search goes on from the depth the background search completed.
+    # With 'pvs' set, the search is a principal variation search (NegaScout): every move but
+    # the first is searched with a null window and only searched again if it turns out better,
+    # and each iteration starts with an aspiration window around the previous iteration's value.
+    # The bounds proved for every position and depth are kept, so re-searches are cheap.
+    # This relies on integer evaluations, which all the evaluators in evaluate.py return.
+    TT_SIZE = 1000000
+    PARALLEL_MIN_DEPTH = 3
+    ENDGAME_EMPTIES = 14
+    ENDGAME_TIME_MS = 3000
+    ASPIRATION_WINDOW = 8
+
+    def __init__(self, depth, verbose=False, workers=None, endgame_empties=ENDGAME_EMPTIES, book=None,
+                 evaluator=None, pvs=False):
+        super().__init__(workers)
         self.depth = depth
+        self.pvs = pvs
+        # leaf evaluation function, see evaluate.py
+        self.evaluator = evaluate.get(evaluator)
+        self.verbose = verbose
+        self.endgame_empties = endgame_empties
+        self.book = book
+        self.tt = {}
+        self.bounds = {}
+        self.killers = {}
+        self.history = {}
+        self.deadline = None
+        # set by the opponent's move while pondering (a multiprocessing.Event)
+        self.stop = None
+        # in a parallel root search worker: the shared root bound, the value of it the current
+        # search started from and whether the root player maximizes
+        self.shared_bound = None
+        self.search_bound = None
+        self.root_maximizing = True
+        # number of TT entries (in insertion order) already sent to the workers
+        self.tt_sent = 0
+        # in a worker: the TT entries stored by the current task
+        self.tt_changes = None
+        # background searches: (process, connection) pairs and the event that stops them
+        self.pondering = []
+        self.ponder_stop = None
+        self.ponder_hits = 0
+        # value (for PLAYER1) of the move returned by the last call to choose_move
+        self.best_value = None
+        self.reset_stats()
+
+    def worker_copy(self):
+        worker = super().worker_copy()
+        worker.book = None
+        worker.tt = {}
+        worker.bounds = {}
+        worker.killers = {}
+        worker.history = {}
+        worker.pondering = []
+        worker.ponder_stop = None
+        worker.shared_bound = None
+        return worker
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['pondering'] = []
+        state['ponder_stop'] = None
+        state['shared_bound'] = None
+        return state
+
+    def close(self):
+        self.stop_pondering()
+        super().close()
+
+    def reset_stats(self):
+        self.nodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.researches = 0
+
+    # Fraction of the beta cutoffs that happened on the first move searched
+    def first_move_cutoff_rate(self):
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    # Resets the per-move statistics and tables before a new search
+    def new_search(self):
+        self.reset_stats()
+        self.killers = {}
+        if len(self.tt) > self.TT_SIZE:
+            self.tt.clear()
+            self.tt_sent = 0
+        if len(self.bounds) > self.TT_SIZE:
+            self.bounds.clear()
+        # age the history table so that old results don't dominate the ordering
+        for square in self.history:
+            self.history[square] //= 2
 
     def choose_move(self, state):
+        ponder_results = self.stop_pondering()
+        self.new_search()
+        move = self.book_move(state)
+        if move == None:
+            move = self.solve_endgame(state, self.ENDGAME_TIME_MS)
+        if move != None:
+            return move
+
+        maximizing_player = state.nextPlayerToMove == othello.PLAYER1
+        completed_depth, best_move, best_value = self.ponder_result(state, ponder_results)
+        # iterative deepening: every iteration fills the TT, killer and history tables
+        # that the next (deeper) iteration uses to order its moves
+        for depth in range(completed_depth + 1, self.depth + 1):
+            if self.workers and depth == self.depth and depth >= self.PARALLEL_MIN_DEPTH:
+                best_move, best_value = self.search_root_parallel(state, depth, maximizing_player)
+            else:
+                best_move, best_value = self.search_iteration(state, depth, maximizing_player, best_value)
+        self.best_value = best_value
+
+        if self.verbose:
+            print("AlphaBeta: depth {}, {} nodes, first-move cutoff rate {:.1%}, {} re-searches".format(
+                self.depth, self.nodes, self.first_move_cutoff_rate(), self.researches))
+        return best_move
+
+    # Searches the root to 'depth'. With PVS, the search starts with an aspiration window
+    # around the value of the previous iteration, and is repeated with the full window if
+    # the value falls outside of it.
+    def search_iteration(self, state, depth, maximizing_player, previous_value):
+        if self.pvs and previous_value != None and abs(previous_value) != float('inf'):
+            alpha = previous_value - self.ASPIRATION_WINDOW
+            beta = previous_value + self.ASPIRATION_WINDOW
+            best_move, best_value = self.search_root(state, depth, maximizing_player, alpha, beta)
+            if alpha < best_value < beta:
+                return best_move, best_value
+            self.researches += 1
+        return self.search_root(state, depth, maximizing_player)
+
+    def search_root(self, state, depth, maximizing_player, alpha=float('-inf'), beta=float('inf')):
         best_move = None
-        best_value = float('-inf')
-        alpha = float('-inf')
-        beta = float('inf')
+        best_value = float('-inf') if maximizing_player else float('inf')
+        key = state.key()
 
-        for move in state.generateMoves():
+        for i, move in enumerate(self.order_moves(state, state.generateMoves(), 0, self.tt.get(key))):
             next_state = state.applyMoveCloning(move)
-            value = self.alphabeta(next_state, self.depth - 1, False, alpha, beta)
-            if value > best_value:
-                best_value = value
-                best_move = move
-            alpha = max(alpha, best_value)
-        return best_move
+            value = self.search_move(next_state, depth - 1, not maximizing_player, alpha, beta, 1, i == 0)
+            if maximizing_player:
+                if value > best_value:
+                    best_value = value
+                    best_move = move
+                alpha = max(alpha, best_value)
+            else:
+                if value < best_value:
+                    best_value = value
+                    best_move = move
+                beta = min(beta, best_value)
+            if beta <= alpha:
+                break  # only with an aspiration window
+
+        if best_move != None:
+            self.store_move(key, best_move)
+        return best_move, best_value
+
+    # Starts searching the positions after the opponent's 'cores' most likely replies in 'state',
+    # one background process each. The replies are ordered like the moves of the search, so
+    # the reply of the principal variation comes first.
+    def start_pondering(self, state, cores):
+        self.stop_pondering()
+        moves = state.generateMoves()
+        if moves:
+            replies = self.order_moves(state, moves, 0, self.tt.get(state.key()))[:cores]
+            positions = [state.applyMoveCloning(move) for move in replies]
+        else:
+            positions = [state.passCloning()]
+        self.ponder_stop = multiprocessing.Event()
+        for position in positions:
+            if position.game_over():
+                continue
+            worker = self.worker_copy()
+            worker.tt = self.tt
+            worker.history = dict(self.history)
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=_ponder, args=(worker, position, self.ponder_depth(position), self.ponder_stop, sender),
+                daemon=True)
+            process.start()
+            sender.close()
+            self.pondering.append((process, receiver))
+
+    # Stops the background searches and returns their results
+    def stop_pondering(self):
+        if not self.pondering:
+            return []
+        self.ponder_stop.set()
+        results = []
+        for process, receiver in self.pondering:
+            try:
+                results.append(receiver.recv())
+            except EOFError:
+                pass  # the process died without a result
+            receiver.close()
+            process.join()
+        self.pondering = []
+        self.ponder_stop = None
+        return results
+
+    # How deep to ponder on a position
+    def ponder_depth(self, state):
+        return self.depth
+
+    # Takes over the background search of 'state' if there was one: its TT entries, bounds and
+    # history are merged into this agent's tables. Returns the depth it completed, with its
+    # best move and value (0, None, None if 'state' was not predicted).
+    def ponder_result(self, state, results):
+        key = state.key()
+        for result_key, depth, move, value, tt, bounds, history, nodes in results:
+            if result_key == key and depth > 0:
+                self.tt.update(tt)
+                self.bounds.update(bounds)
+                self.history = history
+                self.ponder_hits += 1
+                if self.verbose:
+                    print("AlphaBeta: ponder hit, depth {} already searched ({} nodes)".format(depth, nodes))
+                return depth, move, value
+        return 0, None, None
+
+    def book_move(self, state):
+        if self.book == None:
+            return None
+        move = self.book.lookup(state)
+        if move != None and self.verbose:
+            print("AlphaBeta: book move")
+        return move
 
-    def alphabeta(self, state, depth, maximizing_player, alpha, beta):
+    # Returns the perfect move if the position is close enough to the end of the game to be
+    # solved within 'time_ms', and None otherwise
+    def solve_endgame(self, state, time_ms):
+        if state.num_empties() > self.endgame_empties or not state.generateMoves():
+            return None
+        solver = endgame.EndgameSolver(time_ms)
+        try:
+            move, value = solver.solve(state)
+        except game.SearchTimeout:
+            return None
+        finally:
+            self.nodes += solver.nodes
+        self.best_value = value if state.nextPlayerToMove == othello.PLAYER1 else -value
+        if self.verbose:
+            print("AlphaBeta: endgame solved, {} nodes, final score {:+d}".format(solver.nodes, value))
+        return move
+
+    # Same result as search_root, with the root moves split over the worker processes.
+    # Young brothers wait: the first (most promising) move is searched here with the full
+    # window, so that the other moves start with a useful bound.
+    def search_root_parallel(self, state, depth, maximizing_player):
+        key = state.key()
+        moves = self.order_moves(state, state.generateMoves(), 0, self.tt.get(key))
+        if len(moves) < 2:
+            return self.search_root(state, depth, maximizing_player)
+
+        pool = self.get_pool()
+        first_value = self.alphabeta(state.applyMoveCloning(moves[0]), depth - 1, not maximizing_player,
+                                     float('-inf'), float('inf'), 1)
+        self.bound[0] = first_value
+        self.bound[1] = 0
+        tt_entries = dict(itertools.islice(self.tt.items(), self.tt_sent, None))
+        self.tt_sent = len(self.tt)
+        for _ in range(self.workers):
+            pool.submit(_load_tables, tt_entries, self.history, self.killers)
+        futures = [pool.submit(_alphabeta_root_move, state.applyMoveCloning(move), depth - 1, maximizing_player, index)
+                   for index, move in enumerate(moves) if index > 0]
+        values = [first_value]
+        for future in futures:
+            value, nodes, tt_entries, history_increments = future.result()
+            values.append(value)
+            self.nodes += nodes
+            self.tt.update(tt_entries)
+            for history_key, increment in history_increments.items():
+                self.history[history_key] = self.history.get(history_key, 0) + increment
+
+        # moves that are not better than the bound only return an upper bound of their value,
+        # but the best moves are exact, so this is the first best move in search order
+        best_value = max(values) if maximizing_player else min(values)
+        best_move = moves[values.index(best_value)]
+        self.store_move(key, best_move)
+        return best_move, best_value
+
+    def alphabeta(self, state, depth, maximizing_player, alpha, beta, ply=0):
+        self.nodes += 1
+        if self.nodes % 256 == 0:
+            if self.out_of_time():
+                raise game.SearchTimeout()
+            if self.shared_bound != None and self.bound_improved():
+                raise BoundImproved()
         if depth == 0 or state.game_over():
-            return state.score()
+            return self.evaluator(state)
+
+        moves = state.generateMoves()
+        if not moves:
+            # the player to move has to pass
+            return self.alphabeta(state.passCloning(), depth - 1, not maximizing_player, alpha, beta, ply + 1)
 
+        key = state.key()
+        if self.pvs:
+            bounds = self.bounds.get((key, depth))
+            if bounds != None:
+                lower, upper = bounds
+                if lower >= beta:
+                    return lower
+                if upper <= alpha or lower == upper:
+                    return upper
+        best_move = None
+        alpha_start = alpha
+        beta_start = beta
+        # the moves are made and taken back on 'state' itself instead of on copies, also when
+        # the search is abandoned (timeout, or a better bound in a parallel search worker)
         if maximizing_player:
             best_value = float('-inf')
-            for move in state.generateMoves():
-                next_state = state.applyMoveCloning(move)
-                best_value = max(best_value, self.alphabeta(next_state, depth - 1, False, alpha, beta))
+            for i, move in enumerate(self.order_moves(state, moves, ply, self.tt.get(key))):
+                state.applyMove(move)
+                try:
+                    value = self.search_move(state, depth - 1, False, alpha, beta, ply + 1, i == 0)
+                finally:
+                    state.undoMove()
+                if value > best_value:
+                    best_value = value
+                    best_move = move
                 alpha = max(alpha, best_value)
                 if beta <= alpha:
+                    self.record_cutoff(move, i, depth, ply)
                     break
-            return best_value
         else:
             best_value = float('inf')
-            for move in state.generateMoves():
-                next_state = state.applyMoveCloning(move)
-                best_value = min(best_value, self.alphabeta(next_state, depth - 1, True, alpha, beta))
+            for i, move in enumerate(self.order_moves(state, moves, ply, self.tt.get(key))):
+                state.applyMove(move)
+                try:
+                    value = self.search_move(state, depth - 1, True, alpha, beta, ply + 1, i == 0)
+                finally:
+                    state.undoMove()
+                if value < best_value:
+                    best_value = value
+                    best_move = move
                 beta = min(beta, best_value)
                 if beta <= alpha:
+                    self.record_cutoff(move, i, depth, ply)
                     break
-            return best_value
+
+        # when no move reached the window (all moves failed low for the player to move), the best
+        # move is meaningless: keep the move a previous search stored instead
+        if (best_value > alpha_start) if maximizing_player else (best_value < beta_start):
+            self.store_move(key, best_move)
+        elif key not in self.tt:
+            self.store_move(key, best_move)
+        if self.pvs:
+            self.store_bounds(key, depth, best_value, alpha_start, beta_start)
+        return best_value
+
+    # True if the search has to be abandoned: the deadline has passed, or the pondering was stopped
+    def out_of_time(self):
+        return ((self.deadline != None and time.time() > self.deadline) or
+                (self.stop != None and self.stop.is_set()))
+
+    # Remembers the best move of a position for the move ordering (in a worker, also in the
+    # entries that go back to the main search)
+    def store_move(self, key, move):
+        self.tt[key] = (move.x, move.y)
+        if self.tt_changes != None:
+            self.tt_changes[key] = (move.x, move.y)
+
+    def bound_improved(self):
+        bound = self.shared_bound[0]
+        return bound > self.search_bound if self.root_maximizing else bound < self.search_bound
+
+    # Remembers what a search of the window (alpha, beta) proved about the value of a position
+    # searched to 'depth', so that the re-searches of PVS don't have to search it again
+    def store_bounds(self, key, depth, value, alpha, beta):
+        lower, upper = self.bounds.get((key, depth), (float('-inf'), float('inf')))
+        if value <= alpha:
+            upper = min(upper, value)
+        elif value >= beta:
+            lower = max(lower, value)
+        else:
+            lower = upper = value
+        self.bounds[key, depth] = (lower, upper)
+
+    # Searches the position after a move. With PVS, every move but the first one is first
+    # searched with a null window, which only tells whether it is better than the best move
+    # so far; only if it is, it is searched again with the full window.
+    def search_move(self, state, depth, maximizing_player, alpha, beta, ply, first):
+        if self.pvs and not first:
+            if maximizing_player:
+                # the parent minimizes: is the move below beta?
+                value = self.alphabeta(state, depth, True, beta - 1, beta, ply)
+            else:
+                # the parent maximizes: is the move above alpha?
+                value = self.alphabeta(state, depth, False, alpha, alpha + 1, ply)
+            if value <= alpha or value >= beta:
+                return value
+            self.researches += 1
+        return self.alphabeta(state, depth, maximizing_player, alpha, beta, ply)
+
+    def order_moves(self, state, moves, ply, tt_move=None):
+        weights = othello.square_weights(state.boardSize)
+        killers = self.killers.get(ply, ())
+        history = self.history
+
+        def priority(move):
+            square = (move.x, move.y)
+            return (square == tt_move, weights[move.x][move.y], square in killers,
+                    history.get((move.player, move.x, move.y), 0))
+
+        return sorted(moves, key=priority, reverse=True)
+
+    def record_cutoff(self, move, index, depth, ply):
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+        square = (move.x, move.y)
+        killers = self.killers.setdefault(ply, [])
+        if square not in killers:
+            killers.insert(0, square)
+            del killers[2:]
+        history_key = (move.player, move.x, move.y)
+        self.history[history_key] = self.history.get(history_key, 0) + depth * depth
+
+    # Follows the best moves stored in the TT from 'state', i.e. the principal variation
+    def principal_variation(self, state, max_length):
+        pv = []
+        while len(pv) < max_length and not state.game_over():
+            square = self.tt.get(state.key())
+            if square == None:
+                break
+            move = othello.OthelloMove(state.nextPlayerToMove, square[0], square[1])
+            pv.append(move)
+            state = state.applyMoveCloning(move)
+        return pv
+
+class IterativeDeepening(AlphaBeta):
+    # Searches with increasing depth until 'time_ms' milliseconds have passed and plays the
+    # best move of the last iteration that completed. An unfinished iteration is abandoned
+    # as soon as the deadline passes. The first iteration always completes, so a legal
+    # move is returned even with a tiny budget.
+
+    def __init__(self, time_ms, verbose=False, endgame_empties=AlphaBeta.ENDGAME_EMPTIES, book=None,
+                 evaluator=None, pvs=False):
+        super().__init__(0, verbose, endgame_empties=endgame_empties, book=book, evaluator=evaluator, pvs=pvs)
+        self.time_ms = time_ms
+
+    def choose_move(self, state):
+        start_time = time.time()
+        ponder_results = self.stop_pondering()
+        self.new_search()
+        move = self.book_move(state)
+        if move == None:
+            # if the endgame cannot be solved in half of the time, the rest goes to the normal search
+            move = self.solve_endgame(state, self.time_ms / 2)
+        if move != None:
+            return move
+
+        maximizing_player = state.nextPlayerToMove == othello.PLAYER1
+        completed_depth, best_move, best_value = self.ponder_result(state, ponder_results)
+        self.deadline = start_time + self.time_ms / 1000.0 if completed_depth else None
+        try:
+            # deeper than the number of empty squares there is nothing left to search
+            for depth in range(completed_depth + 1, state.num_empties() + 1):
+                # the root is ordered by the TT, so the previous iteration's best move and
+                # the rest of its principal variation are searched first
+                best_move, best_value = self.search_iteration(state, depth, maximizing_player, best_value)
+                completed_depth = depth
+                self.deadline = start_time + self.time_ms / 1000.0
+                if time.time() > self.deadline:
+                    break
+        except game.SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+        self.depth = completed_depth
+        self.best_value = best_value
+
+        if self.verbose:
+            pv = " ".join("{},{}".format(m.x, m.y) for m in self.principal_variation(state, completed_depth))
+            print("IterativeDeepening: depth {} in {:.0f} ms, {} nodes, first-move cutoff rate {:.1%}, pv {}".format(
+                completed_depth, (time.time() - start_time) * 1000, self.nodes,
+                self.first_move_cutoff_rate(), pv))
+        return best_move
+
+    # Without a fixed depth, the pondering goes on until the opponent moves
+    def ponder_depth(self, state):
+        return state.num_empties()
+
+class MCTSAgent(game.Player):
+    # Monte Carlo Tree Search (see mcts.py) with a budget of 'iterations' playouts and/or
+    # 'time_ms' milliseconds per move. The subtree of the position reached after the
+    # opponent's reply is kept for the next move. At least one of the budgets must be given.
+
+    def __init__(self, iterations=None, time_ms=None, verbose=False):
+        super().__init__()
+        if iterations == None and time_ms == None:
+            raise ValueError("MCTSAgent needs a number of iterations or a time per move")
+        self.iterations = iterations
+        self.time_ms = time_ms
+        self.verbose = verbose
+        self.search = None
+        self.nodes = 0
+
+    def choose_move(self, state):
+        start_time = time.time()
+        if self.search == None or not self.search.find(state):
+            self.search = mcts.Search(state)
+        reused = self.search.root.visits
+
+        deadline = start_time + self.time_ms / 1000.0 if self.time_ms != None else None
+        self.nodes = 0
+        while self.iterations == None or self.nodes < self.iterations:
+            self.search.iterate()
+            self.nodes += 1
+            if deadline != None and self.nodes % 16 == 0 and time.time() > deadline:
+                break
+
+        move = self.search.best_move()
+        if self.verbose:
+            elapsed = time.time() - start_time
+            print("MCTSAgent: {} playouts in {:.0f} ms ({:.0f}/s), {} reused".format(
+                self.nodes, elapsed * 1000, self.nodes / elapsed if elapsed > 0 else 0, reused))
+        self.search.advance(move)
+        return move
+
+# Time controlled player, created by main.py for the 'extra' option
+def extra(time_ms, book=None, evaluator=None):
+    return IterativeDeepening(time_ms, book=book, evaluator=evaluator)
@@ -0,0 +1,176 @@
+import concurrent.futures
+import functools
+import mmap
+import struct
+import sys
+
+import agent
+import othello
+
+# Opening book.
+# The book is built offline by searching the positions of the first plies of the game with a
+# deep AlphaBeta search. The 8 symmetries of the board give the same best move (transformed),
+# so every position is stored once under its canonical key: the smallest encoding among
+# its 8 transformed boards.
+#
+# File format (all integers big-endian):
+#   header:  b'OBK1', boardSize (1 byte), key length (1 byte), number of records (4 bytes)
+#   records: key, best move (1 byte: i*boardSize+j on the canonical board), score (2 bytes,
+#            signed, final disc difference estimate for the player to move)
+# The records have a fixed size and are sorted by key, so the reader finds a position with a
+# binary search directly on the memory-mapped file, without loading the book into memory.
+
+MAGIC = b'OBK1'
+HEADER = struct.Struct('>4sBBI')
+VALUE = struct.Struct('>Bh')
+NO_MOVE = 255
+
+# The 8 symmetries of the square board, as functions of (i, j, last index)
+SYMMETRIES = [
+    lambda i, j, l: (i, j),
+    lambda i, j, l: (j, l - i),
+    lambda i, j, l: (l - i, l - j),
+    lambda i, j, l: (l - j, i),
+    lambda i, j, l: (j, i),
+    lambda i, j, l: (l - j, l - i),
+    lambda i, j, l: (l - i, j),
+    lambda i, j, l: (i, l - j),
+]
+# index of the symmetry that undoes each symmetry
+INVERSE = [0, 3, 2, 1, 4, 5, 6, 7]
+
+def key_length(boardSize):
+    return (boardSize * boardSize + 3) // 4 + 1
+
+# Packs a board (given as a flat list of squares) and the player to move, 2 bits per square
+def encode(squares, player):
+    key = bytearray((len(squares) + 3) // 4 + 1)
+    for index, value in enumerate(squares):
+        key[index // 4] |= value << (2 * (3 - index % 4))
+    key[-1] = player
+    return bytes(key)
+
+# For every symmetry, the list giving for each square of the transformed board the square
+# of the original board it comes from
+@functools.lru_cache(maxsize=None)
+def permutations(boardSize):
+    last = boardSize - 1
+    result = []
+    for symmetry in SYMMETRIES:
+        permutation = [0] * (boardSize * boardSize)
+        for i in range(boardSize):
+            for j in range(boardSize):
+                ti, tj = symmetry(i, j, last)
+                permutation[ti * boardSize + tj] = i * boardSize + j
+        result.append(permutation)
+    return result
+
+# Returns (canonical key, symmetry that maps the board of 'state' onto the canonical board)
+def canonical(state):
+    squares = [value for row in state.board for value in row]
+    best = None
+    # packing keeps the order of the boards, so the smallest one can be found unpacked
+    for s, permutation in enumerate(permutations(state.boardSize)):
+        board = bytes(map(squares.__getitem__, permutation))
+        if best == None or board < best[0]:
+            best = (board, s)
+    return encode(best[0], state.nextPlayerToMove), best[1]
+
+def search_position(state, depth):
+    player = agent.AlphaBeta(depth, endgame_empties=0)
+    move = player.choose_move(state)
+    if move == None:
+        return None, 0
+    value = player.best_value if state.nextPlayerToMove == othello.PLAYER1 else -player.best_value
+    return move, value
+
+# Searches every position up to 'plies' moves from the initial position 'depth' plies deep
+# and writes the book to 'path'
+def build(path, plies, depth, workers=None, boardSize=8):
+    positions = {}
+    frontier = [othello.State(boardSize=boardSize)]
+    for ply in range(plies):
+        next_frontier = []
+        for state in frontier:
+            key, s = canonical(state)
+            if key in positions:
+                continue
+            positions[key] = (state, s)
+            for move in state.generateMoves():
+                next_frontier.append(state.applyMoveCloning(move))
+        frontier = next_frontier
+    print("Searching {} positions at depth {}".format(len(positions), depth))
+
+    keys = sorted(positions)
+    states = [positions[key][0] for key in keys]
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        results = list(pool.map(search_position, states, [depth] * len(states), chunksize=4))
+
+    last = boardSize - 1
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, boardSize, key_length(boardSize), len(keys)))
+        for key, (move, value) in zip(keys, results):
+            square = NO_MOVE
+            if move != None:
+                i, j = SYMMETRIES[positions[key][1]](move.x, move.y, last)
+                square = i * boardSize + j
+            f.write(key)
+            f.write(VALUE.pack(square, max(-32768, min(32767, int(value)))))
+    print("Wrote {} positions to {}".format(len(keys), path))
+
+class OpeningBook:
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.boardSize, self.key_length, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(path + " is not an opening book")
+        self.record_size = self.key_length + VALUE.size
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    # Returns (square on the canonical board, score) for the key, or None if it is not in the book
+    def find(self, key):
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER.size + middle * self.record_size
+            record_key = self.data[offset:offset + self.key_length]
+            if record_key < key:
+                low = middle + 1
+            elif record_key > key:
+                high = middle
+            else:
+                return VALUE.unpack_from(self.data, offset + self.key_length)
+        return None
+
+    # Returns the book move for 'state', or None if the position is not in the book
+    def lookup(self, state):
+        if state.boardSize != self.boardSize:
+            return None
+        key, s = canonical(state)
+        entry = self.find(key)
+        if entry == None or entry[0] == NO_MOVE:
+            return None
+        i, j = SYMMETRIES[INVERSE[s]](entry[0] // self.boardSize, entry[0] % self.boardSize, self.boardSize - 1)
+        for move in state.generateMoves():
+            if move.x == i and move.y == j:
+                return move
+        return None
+
+if __name__ == '__main__':
+    # python3 book.py build <file> [plies] [depth] [workers]
+    if len(sys.argv) > 2 and sys.argv[1] == 'build':
+        plies = int(sys.argv[3]) if len(sys.argv) > 3 else 6
+        depth = int(sys.argv[4]) if len(sys.argv) > 4 else 6
+        workers = int(sys.argv[5]) if len(sys.argv) > 5 else None
+        build(sys.argv[2], plies, depth, workers)
+    else:
+        print("usage: python3 book.py build <file> [plies] [depth] [workers]")
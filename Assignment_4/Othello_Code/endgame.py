@@ -0,0 +1,244 @@
+import time
+
+import game
+import othello
+
+# Exact endgame solver.
+# Near the end of the game the whole remaining tree can be searched, which gives the exact
+# final score (the same disc difference as State.score()) instead of a depth-limited guess.
+# The solver works on its own flat copy of the board and makes/unmakes moves in place:
+#  - squares are numbered on a (boardSize+2)^2 grid with a border around the board, so
+#    walking in a direction never needs bounds checks
+#  - the board is split in four quadrants; moves in quadrants with an odd number of empty
+#    squares are tried first (parity: the last move in a region is usually the good one)
+#  - with enough empties left, moves are ordered fastest-first: the moves that leave the
+#    opponent the fewest replies first
+#  - the last few empties are searched by a plain routine without any ordering overhead
+#  - a pass is handled by searching the same position for the opponent, and two passes
+#    in a row end the game
+
+BORDER = 3
+
+# below this number of empties no ordering is worth its cost
+LAST_EMPTIES = 4
+# above this number of empties moves are ordered by opponent mobility
+FASTEST_FIRST_EMPTIES = 6
+
+# Converts a State into the flat board used by the solver
+def flat_board(state):
+    width = state.boardSize + 2
+    board = [BORDER] * (width * width)
+    for i in range(state.boardSize):
+        for j in range(state.boardSize):
+            board[(i + 1) * width + j + 1] = state.board[i][j]
+    return board
+
+def directions(boardSize):
+    width = boardSize + 2
+    return (-width - 1, -width, -width + 1, -1, 1, width - 1, width, width + 1)
+
+def square(boardSize, i, j):
+    return (i + 1) * (boardSize + 2) + j + 1
+
+def coordinates(boardSize, sq):
+    return sq // (boardSize + 2) - 1, sq % (boardSize + 2) - 1
+
+# Places a piece of 'player' on the empty square 'sq' and flips the captured pieces.
+# Returns the list of flipped squares (empty, and the board untouched, if the move is illegal).
+def flip(board, sq, player, opponent, dirs):
+    flipped = []
+    for d in dirs:
+        x = sq + d
+        if board[x] != opponent:
+            continue
+        x += d
+        while board[x] == opponent:
+            x += d
+        if board[x] == player:
+            x -= d
+            while x != sq:
+                board[x] = player
+                flipped.append(x)
+                x -= d
+    if flipped:
+        board[sq] = player
+    return flipped
+
+def undo_flip(board, sq, flipped, opponent):
+    board[sq] = othello.EMPTY
+    for x in flipped:
+        board[x] = opponent
+
+# Number of pieces 'player' would flip by playing on 'sq', without touching the board
+def count_flips(board, sq, player, opponent, dirs):
+    count = 0
+    for d in dirs:
+        x = sq + d
+        if board[x] != opponent:
+            continue
+        n = 1
+        x += d
+        while board[x] == opponent:
+            x += d
+            n += 1
+        if board[x] == player:
+            count += n
+    return count
+
+def is_move(board, sq, player, opponent, dirs):
+    for d in dirs:
+        x = sq + d
+        if board[x] != opponent:
+            continue
+        x += d
+        while board[x] == opponent:
+            x += d
+        if board[x] == player:
+            return True
+    return False
+
+class EndgameSolver:
+
+    def __init__(self, time_ms=None):
+        self.time_ms = time_ms
+        self.nodes = 0
+
+    # Returns (best move, exact final score) for the player to move in 'state'. The score is
+    # the final disc difference from the point of view of the player to move.
+    # Raises game.SearchTimeout if the solve takes longer than 'time_ms'.
+    def solve(self, state):
+        self.nodes = 0
+        self.deadline = time.time() + self.time_ms / 1000.0 if self.time_ms != None else None
+        n = state.boardSize
+        self.board = flat_board(state)
+        self.dirs = directions(n)
+        half = n // 2
+        self.quadrant = {}
+        empties = []
+        for i in range(n):
+            for j in range(n):
+                if state.board[i][j] == othello.EMPTY:
+                    sq = square(n, i, j)
+                    self.quadrant[sq] = 1 << ((i >= half) * 2 + (j >= half))
+                    empties.append(sq)
+        parity = 0
+        for sq in empties:
+            parity ^= self.quadrant[sq]
+
+        player = state.nextPlayerToMove
+        opponent = othello.OTHER_PLAYER[player]
+        diff = state.score() if player == othello.PLAYER1 else -state.score()
+        bound = n * n + 1
+
+        best_move = None
+        alpha = -bound
+        for sq in self.order(empties, player, opponent, parity):
+            flipped = flip(self.board, sq, player, opponent, self.dirs)
+            if not flipped:
+                continue
+            rest = [e for e in empties if e != sq]
+            value = -self.search(opponent, player, -(diff + 2 * len(flipped) + 1), rest,
+                                 parity ^ self.quadrant[sq], -bound, -alpha, False)
+            undo_flip(self.board, sq, flipped, opponent)
+            if value > alpha or best_move == None:
+                alpha = value
+                i, j = coordinates(n, sq)
+                best_move = othello.OthelloMove(player, i, j)
+
+        if best_move == None:
+            return None, -self.search(opponent, player, -diff, empties, parity, -bound, bound, True)
+        return best_move, alpha
+
+    # Negamax search to the end of the game; 'diff' is the disc difference for 'player'
+    def search(self, player, opponent, diff, empties, parity, alpha, beta, passed):
+        self.nodes += 1
+        if self.deadline != None and self.nodes % 1024 == 0 and time.time() > self.deadline:
+            raise game.SearchTimeout()
+        if not empties:
+            return diff
+        if len(empties) <= LAST_EMPTIES:
+            return self.search_last(player, opponent, diff, empties, alpha, beta, passed)
+
+        board = self.board
+        dirs = self.dirs
+        best_value = None
+        for sq in self.order(empties, player, opponent, parity):
+            flipped = flip(board, sq, player, opponent, dirs)
+            if not flipped:
+                continue
+            rest = [e for e in empties if e != sq]
+            value = -self.search(opponent, player, -(diff + 2 * len(flipped) + 1), rest,
+                                 parity ^ self.quadrant[sq], -beta, -alpha, False)
+            undo_flip(board, sq, flipped, opponent)
+            if best_value == None or value > best_value:
+                best_value = value
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+
+        if best_value == None:
+            if passed:
+                return diff  # neither player can move: the game is over
+            return -self.search(opponent, player, -diff, empties, parity, -beta, -alpha, True)
+        return best_value
+
+    # Search of the last few empties, without move ordering
+    def search_last(self, player, opponent, diff, empties, alpha, beta, passed):
+        board = self.board
+        dirs = self.dirs
+        if len(empties) == 1:
+            sq = empties[0]
+            flips = count_flips(board, sq, player, opponent, dirs)
+            if flips:
+                return diff + 2 * flips + 1
+            flips = count_flips(board, sq, opponent, player, dirs)
+            if flips:
+                return diff - 2 * flips - 1
+            return diff
+
+        best_value = None
+        for sq in empties:
+            flipped = flip(board, sq, player, opponent, dirs)
+            if not flipped:
+                continue
+            self.nodes += 1
+            rest = [e for e in empties if e != sq]
+            value = -self.search_last(opponent, player, -(diff + 2 * len(flipped) + 1), rest, -beta, -alpha, False)
+            undo_flip(board, sq, flipped, opponent)
+            if best_value == None or value > best_value:
+                best_value = value
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+
+        if best_value == None:
+            if passed:
+                return diff
+            return -self.search_last(opponent, player, -diff, empties, -beta, -alpha, True)
+        return best_value
+
+    # Orders the empty squares: odd quadrants first, then (with enough empties) by the
+    # number of replies left to the opponent. Squares that are not legal moves are kept,
+    # the search skips them when it cannot flip anything.
+    def order(self, empties, player, opponent, parity):
+        quadrant = self.quadrant
+        if len(empties) <= FASTEST_FIRST_EMPTIES:
+            return sorted(empties, key=lambda sq: not (parity & quadrant[sq]))
+
+        board = self.board
+        dirs = self.dirs
+        scored = []
+        for sq in empties:
+            flipped = flip(board, sq, player, opponent, dirs)
+            if not flipped:
+                continue
+            mobility = 0
+            for e in empties:
+                if e != sq and is_move(board, e, opponent, player, dirs):
+                    mobility += 1
+            undo_flip(board, sq, flipped, opponent)
+            scored.append((mobility, not (parity & quadrant[sq]), sq))
+        scored.sort()
+        return [sq for mobility, odd, sq in scored]
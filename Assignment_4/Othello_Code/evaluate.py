@@ -0,0 +1,63 @@
+import othello
+
+# Evaluation functions for the leaves of the search. All of them return an integer from the
+# point of view of PLAYER1, like State.score().
+#
+#  - 'score':    the disc difference (State.score()), exact but weak before the end
+#  - 'weighted': square weights + mobility + frontier discs + corner/edge stability. The
+#                square weights, the disc difference and the frontier discs are maintained
+#                incrementally by State.applyMove/undoMove, and the stability only follows the
+#                edges from the corners. Mobility is the one O(board) term: it needs the move
+#                lists of both players (cached by State.generateMoves).
+
+MOBILITY_WEIGHT = 10
+FRONTIER_WEIGHT = 5
+STABILITY_WEIGHT = 20
+# finished games are scored far above any heuristic value
+WIN_WEIGHT = 1000
+
+def disc_count(state):
+    return state.score()
+
+# Discs of PLAYER1 minus discs of PLAYER2 that can never be flipped because they are connected
+# to an occupied corner along an edge by discs of the same color
+def edge_stability(state):
+    board = state.board
+    last = state.boardSize - 1
+    stable = set()
+    for ci, cj, di, dj in ((0, 0, 1, 1), (0, last, 1, -1), (last, 0, -1, 1), (last, last, -1, -1)):
+        owner = board[ci][cj]
+        if owner == othello.EMPTY:
+            continue
+        # along the column, then along the row
+        for si, sj in ((di, 0), (0, dj)):
+            i, j = ci, cj
+            while 0 <= i <= last and 0 <= j <= last and board[i][j] == owner:
+                stable.add((i, j))
+                i += si
+                j += sj
+    return sum(1 if board[i][j] == othello.PLAYER1 else -1 for i, j in stable)
+
+def weighted(state):
+    mobility1 = len(state.generateMoves(othello.PLAYER1))
+    mobility2 = len(state.generateMoves(othello.PLAYER2))
+    if mobility1 == 0 and mobility2 == 0:
+        return WIN_WEIGHT * state.score()
+    return (state.squareScore
+            + MOBILITY_WEIGHT * (mobility1 - mobility2)
+            - FRONTIER_WEIGHT * state.frontierDiscs
+            + STABILITY_WEIGHT * edge_stability(state))
+
+EVALUATORS = {
+    'score': disc_count,
+    'weighted': weighted,
+}
+
+# Returns the evaluation function for a name in EVALUATORS (None means 'score'),
+# or the argument itself if it is already a function
+def get(evaluator):
+    if evaluator == None:
+        return disc_count
+    if callable(evaluator):
+        return evaluator
+    return EVALUATORS[evaluator]
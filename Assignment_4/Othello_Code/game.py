@@ -1,41 +1,79 @@
 import othello
+import record
 # import util
 import  time
 
+# Raised inside a search when its deadline has passed
+class SearchTimeout(Exception):
+    pass
+
 class Player:
 
     def choose_move(self, state):
         raise NotImplementedError
 
+    # Called after the player's move when the game is played with pondering: 'state' is the
+    # position with the opponent to move. The player may think in the background on at most
+    # 'cores' processes until its next choose_move. Players that don't ponder ignore this.
+    def start_pondering(self, state, cores):
+        pass
+
+    def stop_pondering(self):
+        pass
+
 
 class Game:
 
-    def __init__(self, initial_state, player1, player2):
+    # With 'ponder' set, every player may use up to 'ponder' processes to think while the
+    # opponent is choosing its move.
+    # The moves are added to 'game_record' (a record.GameRecord, by default a new one), which
+    # must lead from the initial position of the game to 'initial_state'.
+    def __init__(self, initial_state, player1, player2, ponder=0, game_record=None):
         self.initial_state = initial_state
         self.players = [player1, player2]
+        self.ponder = ponder
+        self.record = game_record if game_record != None else record.GameRecord(initial_state.boardSize)
+        # seconds and search nodes spent on every move, for each player
+        self.move_times = [[], []]
+        self.move_nodes = [[], []]
 
-    def play(self):
+    # Plays the game and returns the list of states.
+    # In quiet mode nothing is printed and only the final state is kept; the positions can
+    # still be replayed from self.record.
+    def play(self, quiet=False):
         start_time = time.time()  # Record the start time
         state = self.initial_state.clone()
         states = [state]
-        player_index = 0
         while not state.game_over():
-            # Display the current state in the console:
-            print("\nCurrent state, " + othello.PLAYER_NAMES[state.nextPlayerToMove] + " to move:")
-            print(state)
+            # player1 plays O (PLAYER1) and player2 plays X (PLAYER2)
+            player_index = state.nextPlayerToMove
+            if not quiet:
+                # Display the current state in the console:
+                print("\nCurrent state, " + othello.PLAYER_NAMES[state.nextPlayerToMove] + " to move:")
+                print(state)
             # Get the move from the player:
             player = self.players[player_index]
+            move_start = time.time()
             move = player.choose_move(state)
-            if move != None: print(move)
-            state = state.applyMoveCloning(move)
-            states.append(state)
+            self.move_times[player_index].append(time.time() - move_start)
+            self.move_nodes[player_index].append(getattr(player, 'nodes', 0))
+            self.record.append(move)
+            if quiet:
+                state = state.applyMoveCloning(move) if move != None else state.passCloning()
+                states[-1] = state
+            else:
+                if move != None: print(move)
+                state = state.applyMoveCloning(move)
+                states.append(state)
+            if self.ponder and not state.game_over():
+                player.start_pondering(state, self.ponder)
             # util.pprint(state)
-            player_index = (player_index + 1) % len(self.players)
+        for player in self.players:
+            player.stop_pondering()
         end_time = time.time()  # Record the end time
         elapsed_time = end_time - start_time  # Calculate elapsed time
-        print("\n*** Final winner: " + state.winner() +" ***" )
-        print(state)
-        print(f"Game finished in {elapsed_time:.4f} seconds.")
+        if not quiet:
+            print("\n*** Final winner: " + state.winner() +" ***" )
+            print(state)
+            print(f"Game finished in {elapsed_time:.4f} seconds.")
         return states
-
-
@@ -1,19 +1,33 @@
 import agent
+import book
 import othello
 import game
 import sys
 
-def create_player(arg, depht_or_time):
+# default search depth of minimax and alphabeta
+DEFAULT_DEPTH_OR_TIME = 3
+# default time per move of extra and mcts, in milliseconds
+EXTRA_TIME_MS = 1000
+MCTS_TIME_MS = 1000
+
+# 'depht_or_time' is the search depth of minimax and alphabeta, and the time per move in
+# milliseconds of extra and mcts; None gives each agent its default.
+# 'evaluator' names the leaf evaluation of the search agents (see evaluate.py)
+def create_player(arg, depht_or_time=None, opening_book=None, evaluator=None):
+    if arg == 'mcts':
+        return agent.MCTSAgent(time_ms=depht_or_time if depht_or_time != None else MCTS_TIME_MS)
+    if arg == 'extra':
+        return agent.extra(depht_or_time if depht_or_time != None else EXTRA_TIME_MS, opening_book, evaluator)
+    if depht_or_time == None:
+        depht_or_time = DEFAULT_DEPTH_OR_TIME
     if arg == 'human':
         return agent.HumanPlayer()
     elif arg == 'random':
         return agent.RandomAgent()
     elif arg == 'minimax':
-        return agent.MinimaxAgent(depht_or_time)
+        return agent.MinimaxAgent(depht_or_time, evaluator=evaluator)
     elif arg == 'alphabeta':
-        return agent.AlphaBeta(depht_or_time)
-    elif arg == 'extra':
-        return agent.extra(depht_or_time)
+        return agent.AlphaBeta(depht_or_time, book=opening_book, evaluator=evaluator)
 
     else:
         agent.RandomAgent()
@@ -29,16 +43,20 @@ if __name__ == '__main__':
     if len(sys.argv) > 1:
         agent1 = sys.argv[1]
         agent2 = sys.argv[2]
-        depht_or_time = 3
-    if len(sys.argv) == 4:
+        depht_or_time = None
+    if len(sys.argv) >= 4:
         depht_or_time = int(sys.argv[3])
+    # optional opening book file, built with book.py ('-' for none)
+    opening_book = book.OpeningBook(sys.argv[4]) if len(sys.argv) >= 5 and sys.argv[4] != '-' else None
+    # optional number of processes each agent may use to think on the opponent's time
+    ponder = int(get_arg(5, 0))
 
-    player1 = create_player(get_arg(1), depht_or_time)
-    player2 = create_player(get_arg(2), depht_or_time)
+    player1 = create_player(get_arg(1), depht_or_time, opening_book)
+    player2 = create_player(get_arg(2), depht_or_time, opening_book)
 
     # player1 = agent.HumanPlayer()
     # player2 = agent.RandomAgent()
 
-    game = game.Game(initial_state, player1, player2)
+    game = game.Game(initial_state, player1, player2, ponder)
 
     game.play()
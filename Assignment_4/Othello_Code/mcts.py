@@ -0,0 +1,176 @@
+import math
+import random
+
+import endgame
+import othello
+
+# Monte Carlo Tree Search (UCT) for Othello.
+# The tree is searched on the flat board of endgame.py: every iteration copies the root board
+# once, walks down the tree playing the moves in place, and finishes the game with a random
+# playout that works directly on that copy: no State clones, no OthelloMove objects and no
+# move lists are created during the playout.
+
+PASS = -1
+EXPLORATION = 1.4
+
+class Node:
+
+    def __init__(self, parent, square, player):
+        self.parent = parent
+        self.square = square    # move that leads to this node (PASS for a pass)
+        self.player = player    # player to move in this node
+        self.children = []
+        self.untried = None     # moves not expanded yet, computed on the first visit
+        self.visits = 0
+        self.wins = 0.0         # for the player who made the move leading to this node
+
+    def uct_child(self):
+        log_visits = math.log(self.visits)
+        return max(self.children,
+                   key=lambda c: c.wins / c.visits + EXPLORATION * math.sqrt(log_visits / c.visits))
+
+# Plays on the empty square 'sq' in place and returns the number of flipped discs (0 if illegal)
+def play(board, sq, player, opponent, dirs):
+    count = 0
+    for d in dirs:
+        x = sq + d
+        if board[x] != opponent:
+            continue
+        x += d
+        while board[x] == opponent:
+            x += d
+        if board[x] == player:
+            x -= d
+            while x != sq:
+                board[x] = player
+                count += 1
+                x -= d
+    if count:
+        board[sq] = player
+    return count
+
+# Plays random moves until the end of the game, modifying 'board' and 'empties' in place.
+# 'diff' is the disc difference for PLAYER1, the final one is returned.
+# Trying the empty squares in random order and playing the first legal one picks every legal
+# move with the same probability.
+def rollout(board, empties, player, diff, dirs, rng):
+    passes = 0
+    n = len(empties)
+    while n and passes < 2:
+        opponent = othello.OTHER_PLAYER[player]
+        for k in range(n):
+            j = rng.randrange(k, n)
+            sq = empties[j]
+            empties[j] = empties[k]
+            empties[k] = sq
+            count = play(board, sq, player, opponent, dirs)
+            if count:
+                n -= 1
+                empties[k] = empties[n]
+                empties[n] = sq
+                diff += (2 * count + 1) if player == othello.PLAYER1 else -(2 * count + 1)
+                passes = 0
+                break
+        else:
+            passes += 1
+        player = opponent
+    return diff
+
+class Search:
+
+    def __init__(self, state, rng=None):
+        self.rng = rng or random.Random()
+        self.dirs = endgame.directions(state.boardSize)
+        self.set_root(Node(None, None, state.nextPlayerToMove), state)
+
+    def set_root(self, node, state):
+        node.parent = None
+        self.root = node
+        self.state = state
+        self.board = endgame.flat_board(state)
+        self.empties = [endgame.square(state.boardSize, i, j)
+                        for i in range(state.boardSize) for j in range(state.boardSize)
+                        if state.board[i][j] == othello.EMPTY]
+        self.diff = state.score()
+
+    # Moves the root to the node reached by 'move' (None for a pass), keeping its subtree
+    def advance(self, move):
+        square = PASS if move == None else endgame.square(self.state.boardSize, move.x, move.y)
+        state = self.state.passCloning() if move == None else self.state.applyMoveCloning(move)
+        for child in self.root.children:
+            if child.square == square:
+                self.set_root(child, state)
+                return
+        self.set_root(Node(None, None, state.nextPlayerToMove), state)
+
+    # Moves the root to the child whose position is 'state'. Returns False if there is none.
+    def find(self, state):
+        for child in self.root.children:
+            move = self.move(child)
+            next_state = self.state.passCloning() if move == None else self.state.applyMoveCloning(move)
+            if next_state.nextPlayerToMove == state.nextPlayerToMove and next_state.board == state.board:
+                self.set_root(child, next_state)
+                return True
+        return False
+
+    def move(self, node):
+        if node.square == PASS:
+            return None
+        i, j = endgame.coordinates(self.state.boardSize, node.square)
+        return othello.OthelloMove(node.parent.player, i, j)
+
+    def legal_squares(self, board, empties, player):
+        opponent = othello.OTHER_PLAYER[player]
+        squares = [sq for sq in empties if endgame.is_move(board, sq, player, opponent, self.dirs)]
+        if squares:
+            return squares
+        for sq in empties:
+            if endgame.is_move(board, sq, opponent, player, self.dirs):
+                return [PASS]
+        return []  # game over
+
+    def apply(self, board, empties, node, diff):
+        if node.square == PASS:
+            return diff
+        player = node.parent.player
+        count = play(board, node.square, player, othello.OTHER_PLAYER[player], self.dirs)
+        empties.remove(node.square)
+        return diff + ((2 * count + 1) if player == othello.PLAYER1 else -(2 * count + 1))
+
+    def iterate(self):
+        board = self.board[:]
+        empties = self.empties[:]
+        diff = self.diff
+        node = self.root
+
+        # selection
+        while node.untried == [] and node.children:
+            node = node.uct_child()
+            diff = self.apply(board, empties, node, diff)
+
+        # expansion
+        if node.untried == None:
+            node.untried = self.legal_squares(board, empties, node.player)
+        if node.untried:
+            square = node.untried.pop(self.rng.randrange(len(node.untried)))
+            child = Node(node, square, othello.OTHER_PLAYER[node.player])
+            node.children.append(child)
+            node = child
+            diff = self.apply(board, empties, node, diff)
+
+        # simulation
+        diff = rollout(board, empties, node.player, diff, self.dirs, self.rng)
+
+        # backpropagation
+        result = 1.0 if diff > 0 else 0.0 if diff < 0 else 0.5
+        while node.parent != None:
+            node.visits += 1
+            node.wins += result if node.parent.player == othello.PLAYER1 else 1.0 - result
+            node = node.parent
+        node.visits += 1
+
+    # The most visited move at the root (None for a pass)
+    def best_move(self):
+        if not self.root.children:
+            return None
+        return self.move(max(self.root.children, key=lambda c: c.visits))
@@ -1,7 +1,7 @@
 import math
 import random
 import sys
-import copy
+import functools
 
 EMPTY = 2
 PLAYER1 = 0
@@ -9,6 +9,34 @@ PLAYER2 = 1
 PLAYER_NAMES = ["O", "X", "."]
 OTHER_PLAYER = {PLAYER1:PLAYER2, PLAYER2:PLAYER1}
 
+# these two arrays encode the 8 posible directions in which a player can capture pieces:
+OFFS_X = [ 0, 1, 1, 1, 0,-1,-1,-1]
+OFFS_Y = [-1,-1, 0, 1, 1, 1, 0,-1]
+
+# Static square weights used for move ordering: corners are the most valuable squares,
+# the squares next to an empty corner (C and X squares) the most dangerous ones.
+@functools.lru_cache(maxsize=None)
+def square_weights(boardSize):
+    last = boardSize - 1
+    weights = [[1] * boardSize for i in range(boardSize)]
+    for i in range(boardSize):
+        for j in range(boardSize):
+            if i in (1, last - 1) or j in (1, last - 1):
+                weights[i][j] = -2
+            if i in (0, last) or j in (0, last):
+                weights[i][j] = 10
+    for ci in (0, last):
+        for cj in (0, last):
+            di = 1 if ci == 0 else -1
+            dj = 1 if cj == 0 else -1
+            weights[ci + di][cj] = -20
+            weights[ci][cj + dj] = -20
+            weights[ci + di][cj + dj] = -50
+    for ci in (0, last):
+        for cj in (0, last):
+            weights[ci][cj] = 100
+    return tuple(tuple(row) for row in weights)
+
 class OthelloMove:
     def __init__(self, player , x , y ):
         self.player = player
@@ -22,6 +50,9 @@ class OthelloMove:
 class State:
     def __init__(self, board = None, boardSize = 8, nextPlayerToMove = PLAYER1):
         
+        # legal moves of each player in the current position, filled lazily by generateMoves
+        self.moveCache = {}
+
         if board:
             self.board = board
             self.boardSize = boardSize
@@ -40,6 +71,68 @@ class State:
             self.board[boardSize//2][boardSize//2] = PLAYER1
             self.board[boardSize//2-1][boardSize//2] = PLAYER2
             self.board[boardSize//2][boardSize//2-1] = PLAYER2
+
+        # moves applied with applyMove, so that undoMove can take them back
+        self.undoStack = []
+        self.computeScores()
+        self.computeFrontier()
+
+    # Computes from scratch the disc difference, the sum of the square weights of the discs and
+    # the number of frontier discs (discs next to an empty square), all PLAYER1 minus PLAYER2.
+    # applyMove and undoMove then keep them up to date, so that evaluating a position does not
+    # need to look at the whole board.
+    def computeScores(self):
+        weights = square_weights(self.boardSize)
+        self.discs = 0
+        self.squareScore = 0
+        for i in range(self.boardSize):
+            for j in range(self.boardSize):
+                if self.board[i][j] == PLAYER1:
+                    self.discs += 1
+                    self.squareScore += weights[i][j]
+                if self.board[i][j] == PLAYER2:
+                    self.discs -= 1
+                    self.squareScore -= weights[i][j]
+        self.frontierDiscs = self.countFrontierDiscs(
+            [(i, j) for i in range(self.boardSize) for j in range(self.boardSize)])
+
+    # Computes from scratch the set of empty squares next to at least one disc. Only these can be
+    # legal moves, so move generation looks at them instead of the whole board; applyMove and
+    # undoMove keep the set up to date, which makes large boards practical.
+    def computeFrontier(self):
+        self.frontier = set()
+        for i in range(self.boardSize):
+            for j in range(self.boardSize):
+                if self.board[i][j] != EMPTY:
+                    continue
+                if self.touchesDisc(i, j):
+                    self.frontier.add((i, j))
+
+    # Returns whether any of the 8 neighbors of (i, j) holds a disc
+    def touchesDisc(self, i, j):
+        for k in range(len(OFFS_X)):
+            x = i + OFFS_X[k]
+            y = j + OFFS_Y[k]
+            if self.is_legal(x, y) and self.board[x][y] != EMPTY:
+                return True
+        return False
+
+    # Returns whether any of the 8 neighbors of (i, j) is empty
+    def touchesEmpty(self, i, j):
+        for k in range(len(OFFS_X)):
+            x = i + OFFS_X[k]
+            y = j + OFFS_Y[k]
+            if self.is_legal(x, y) and self.board[x][y] == EMPTY:
+                return True
+        return False
+
+    # Frontier discs of PLAYER1 minus those of PLAYER2 among 'squares'
+    def countFrontierDiscs(self, squares):
+        count = 0
+        for i, j in squares:
+            if self.board[i][j] != EMPTY and self.touchesEmpty(i, j):
+                count += 1 if self.board[i][j] == PLAYER1 else -1
+        return count
     
     # Converts a game board to a string, for displaying it via the console
     def __str__(self):
@@ -54,7 +147,22 @@ class State:
         return self.board == state.board
 
     def clone(self):
-        return State(copy.deepcopy(self.board), self.boardSize, self.nextPlayerToMove)
+        # copies the incrementally maintained fields instead of recomputing them
+        newState = State.__new__(State)
+        newState.board = [row[:] for row in self.board]
+        newState.boardSize = self.boardSize
+        newState.nextPlayerToMove = self.nextPlayerToMove
+        newState.moveCache = {}
+        newState.undoStack = []
+        newState.discs = self.discs
+        newState.squareScore = self.squareScore
+        newState.frontierDiscs = self.frontierDiscs
+        newState.frontier = set(self.frontier)
+        return newState
+
+    # Hashable key identifying the position (board and player to move), e.g. for transposition tables
+    def key(self):
+        return (tuple(tuple(row) for row in self.board), self.nextPlayerToMove)
 
     def is_legal(self, x, y):
         return x >= 0 and x < self.boardSize and y >= 0 and y < self.boardSize
@@ -73,70 +181,101 @@ class State:
         return self.board == state.board
     
     # Determines whether the game is over or not
+    # The moves of the player to move are needed by the search anyway, so that list is generated
+    # (and cached); for the other player it is enough to know whether there is any move at all.
     def game_over(self):
-        return len(self.generateMoves(PLAYER1)) == 0 and len(self.generateMoves(PLAYER2)) == 0
+        return (len(self.generateMoves(self.nextPlayerToMove)) == 0 and
+                not self.has_moves(OTHER_PLAYER[self.nextPlayerToMove]))
 
     # Returns the final score, once a game is over
     def score(self):
-        score = 0
-        for i in range(self.boardSize):
-            for j in range(self.boardSize):
-                if self.board[i][j] == PLAYER1:
-                    score += 1
-                if self.board[i][j] == PLAYER2:
-                    score -= 1
-        return score
+        return self.discs
     
     #  Returns the list of possible moves for player 'player'
+    #  The list is computed once per position and cached, so it must not be modified by the caller.
     def generateMoves(self, player = None):
 
         if player == None:
             player = self.nextPlayerToMove
-        moves = []
-
-        # these two arrays encode the 8 posible directions in which a player can capture pieces:
-        offs_x = [ 0, 1, 1, 1, 0,-1,-1,-1]
-        offs_y = [-1,-1, 0, 1, 1, 1, 0,-1]
+        moves = self.moveCache.get(player)
+        if moves != None:
+            return moves
 
-        for i in range(self.boardSize):
-            for j in range(self.boardSize):
-                if self.board[i][j] == EMPTY :
-                    moveFound = False
-                    for k in range(len(offs_x)):
-                        if not moveFound:
-                            current_x = i + offs_x[k]
-                            current_y = j + offs_y[k]
-                            while(current_x+offs_x[k]>=0 and current_x+offs_x[k]< self.boardSize and
-                                current_y+offs_y[k]>=0 and current_y+offs_y[k]<self.boardSize and
-                                self.board[current_x][current_y] == OTHER_PLAYER[player]):
-                                current_x += offs_x[k]
-                                current_y += offs_y[k]
-                                if self.board[current_x][current_y] == player:
-                                    #  Legal move:
-                                    moveFound = True
-                                    moves.append(OthelloMove(player, i, j))
+        # sorted, so that the moves come in the same order as when scanning the board
+        moves = [OthelloMove(player, i, j) for i, j in sorted(self.frontier) if self.is_move(i, j, player)]
+        self.moveCache[player] = moves
         return moves
 
+    # Returns whether 'player' has at least one legal move, stopping at the first one found
+    def has_moves(self, player):
+        moves = self.moveCache.get(player)
+        if moves != None:
+            return len(moves) > 0
+
+        for i, j in self.frontier:
+            if self.is_move(i, j, player):
+                return True
+        return False
+
+    # Returns whether placing a piece of 'player' on the empty square (i, j) captures anything
+    def is_move(self, i, j, player):
+        opponent = OTHER_PLAYER[player]
+        for k in range(len(OFFS_X)):
+            current_x = i + OFFS_X[k]
+            current_y = j + OFFS_Y[k]
+            while(current_x+OFFS_X[k]>=0 and current_x+OFFS_X[k]< self.boardSize and
+                current_y+OFFS_Y[k]>=0 and current_y+OFFS_Y[k]<self.boardSize and
+                self.board[current_x][current_y] == opponent):
+                current_x += OFFS_X[k]
+                current_y += OFFS_Y[k]
+                if self.board[current_x][current_y] == player:
+                    #  Legal move:
+                    return True
+        return False
 
      
     # Modifies the game state as for applying the given 'move'
     # Notice that move can be "null", which means that the player passes.
     # "passing" is only allowed if a player has no other moves available.
-    def applyMove(self, move):
+    # With 'undoable' False the move is not recorded for undoMove.
+    def applyMove(self, move, undoable=True):
 
         if move == None:
             print("\nPlayer " + PLAYER_NAMES[self.nextPlayerToMove] + " passes the move!")
+            if undoable:
+                self.undoStack.append((None, None, self.nextPlayerToMove, None, 0))
             self.nextPlayerToMove = OTHER_PLAYER[self.nextPlayerToMove]
             return #player passes
 
+        flipped = []
+        # empty squares that join the frontier with this move
+        added = []
+        # discs around the move and the change of the frontier-disc count
+        around = []
+        frontierChange = 0
+        player = self.nextPlayerToMove
         self.nextPlayerToMove = OTHER_PLAYER[self.nextPlayerToMove]
+        self.moveCache = {}
         
         # set the piece:
         self.board[move.x][move.y] = move.player
+        self.frontier.discard((move.x, move.y))
+        for k in range(len(OFFS_X)):
+            x = move.x + OFFS_X[k]
+            y = move.y + OFFS_Y[k]
+            if not self.is_legal(x, y):
+                continue
+            if self.board[x][y] == EMPTY:
+                if (x, y) not in self.frontier:
+                    self.frontier.add((x, y))
+                    added.append((x, y))
+            else:
+                # the discs around the move all touched an empty square (the move) before it
+                around.append((x, y))
+                frontierChange -= 1 if self.board[x][y] == PLAYER1 else -1
         
-        # these two arrays encode the 8 posible directions in which a player can capture pieces:
-        offs_x = [ 0, 1, 1, 1, 0,-1,-1,-1]
-        offs_y = [-1,-1, 0, 1, 1, 1, 0,-1]
+        offs_x = OFFS_X
+        offs_y = OFFS_Y
         
         # see if any pieces are captured:
         for i in range(len(offs_x)):
@@ -153,14 +292,62 @@ class State:
                     reversed_y = move.y + offs_y[i]
                     while reversed_x!=current_x or reversed_y!=current_y :
                         self.board[reversed_x][reversed_y] = move.player
+                        flipped.append((reversed_x, reversed_y))
                         reversed_x += offs_x[i]
                         reversed_y += offs_y[i]
                     break
 
-    # Creates a new game state that has the result of applying move 'move'
+        # only the discs around the move can stop touching an empty square; the other flipped
+        # discs stay where they were in the frontier, but change color
+        frontierChange += self.countFrontierDiscs(around + [(move.x, move.y)])
+        frontierChange += 2 * self.countFrontierDiscs(
+            [(x, y) for x, y in flipped if max(abs(x - move.x), abs(y - move.y)) > 1])
+        self.frontierDiscs += frontierChange
+        if undoable:
+            self.undoStack.append((move, flipped, player, added, frontierChange))
+        self.updateScores(move, flipped, 1 if move.player == PLAYER1 else -1)
+
+    # Takes back the last move (or pass) applied with applyMove
+    def undoMove(self):
+        move, flipped, player, added, frontierChange = self.undoStack.pop()
+        self.nextPlayerToMove = player
+        if move == None:
+            return
+
+        self.moveCache = {}
+        self.board[move.x][move.y] = EMPTY
+        self.frontier.difference_update(added)
+        if self.touchesDisc(move.x, move.y):
+            self.frontier.add((move.x, move.y))
+        self.frontierDiscs -= frontierChange
+        opponent = OTHER_PLAYER[move.player]
+        for x, y in flipped:
+            self.board[x][y] = opponent
+        self.updateScores(move, flipped, -1 if move.player == PLAYER1 else 1)
+
+    # Adds (sign 1) or removes (sign -1) the effect of placing 'move' and flipping 'flipped'
+    # to the disc difference and the square-weight sum. Costs O(flipped discs).
+    def updateScores(self, move, flipped, sign):
+        weights = square_weights(self.boardSize)
+        self.discs += sign * (1 + 2 * len(flipped))
+        weight = weights[move.x][move.y]
+        for x, y in flipped:
+            weight += 2 * weights[x][y]
+        self.squareScore += sign * weight
+
+    # Creates a new game state that has the result of applying move 'move'. The move is not
+    # recorded for undoMove: the original state is still there.
     def applyMoveCloning(self, move):
         newState = self.clone()
-        newState.applyMove(move)
+        newState.applyMove(move, undoable=False)
+        return newState
+
+    # Creates a new game state in which the player to move passes (without printing anything)
+    def passCloning(self):
+        newState = self.clone()
+        newState.nextPlayerToMove = OTHER_PLAYER[self.nextPlayerToMove]
+        # same board, so the legal moves of both players are unchanged
+        newState.moveCache = self.moveCache
         return newState
 
     def winner(self):
@@ -0,0 +1,198 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import agent
+import othello
+
+# Move generator tests and search benchmarks.
+#
+# perft counts the leaf nodes of the game tree to a fixed depth. A pass counts as a move and a
+# finished game is a leaf even if the depth is not reached yet. The counts of the initial
+# position are the published Othello perft numbers; the counts of the other positions were
+# recorded with the generator once it matched those.
+#
+#   python3 perft.py perft [depth]                 check the move generator
+#   python3 perft.py check [depth]                 check applyMove/undoMove: at every node of
+#                                                  the tree, the incrementally maintained fields
+#                                                  must match the ones computed from scratch
+#   python3 perft.py bench [depth] [--save FILE] [--baseline FILE]
+#                                                  time fixed-depth searches and compare them
+#                                                  with a previous run
+
+POSITIONS = {
+    'initial': (['........',
+                 '........',
+                 '........',
+                 '...OX...',
+                 '...XO...',
+                 '........',
+                 '........',
+                 '........'], othello.PLAYER1),
+    'midgame': (['..O.O...',
+                 'XXOOO...',
+                 'XXXXO...',
+                 'XOOXOO..',
+                 '.XOOXOO.',
+                 'X...XXX.',
+                 '........',
+                 '........'], othello.PLAYER1),
+    'endgame': (['..XXXXX.',
+                 'OOOOOXXX',
+                 '.XXXXOXO',
+                 'X.XXOOXO',
+                 'XXXXXXXX',
+                 'X..XOXXX',
+                 '...OXXXX',
+                 '..OX.X.X'], othello.PLAYER1),
+}
+
+PERFT = {
+    'initial': [4, 12, 56, 244, 1396, 8200, 55092, 390216, 3005288],
+    'midgame': [9, 126, 1184, 15632, 150834],
+    'endgame': [7, 42, 280, 1500, 9271, 42309, 230792],
+}
+
+# default depths, chosen so that the whole suite runs in a few seconds
+PERFT_DEPTH = {'initial': 6, 'midgame': 4, 'endgame': 6}
+BENCH_DEPTH = {'initial': 5, 'midgame': 4, 'endgame': 5}
+
+def parse_position(rows, player):
+    board = [[othello.PLAYER_NAMES.index(c) for c in row] for row in rows]
+    return othello.State(board, len(rows), player)
+
+def perft(state, depth):
+    if depth == 0:
+        return 1
+    moves = state.generateMoves()
+    if not moves:
+        if not state.has_moves(othello.OTHER_PLAYER[state.nextPlayerToMove]):
+            return 1  # game over
+        return perft(state.passCloning(), depth - 1)
+    if depth == 1:
+        return len(moves)
+    return sum(perft(state.applyMoveCloning(move), depth - 1) for move in moves)
+
+# The fields State keeps up to date in applyMove/undoMove
+def incremental_fields(state):
+    return (state.board, state.nextPlayerToMove, state.discs, state.squareScore,
+            state.frontierDiscs, state.frontier)
+
+# Walks the tree like perft, but making and taking back the moves on 'state' itself. Returns
+# the number of nodes whose fields did not match a position built from scratch.
+def check_incremental(state, depth):
+    rebuilt = othello.State([row[:] for row in state.board], state.boardSize, state.nextPlayerToMove)
+    errors = 0 if incremental_fields(state) == incremental_fields(rebuilt) else 1
+    if depth == 0:
+        return errors
+    before = incremental_fields(rebuilt)
+    for move in state.generateMoves():
+        state.applyMove(move)
+        errors += check_incremental(state, depth - 1)
+        state.undoMove()
+        if incremental_fields(state) != before:
+            errors += 1
+    return errors
+
+# Returns True if all the counts match
+def run_perft(max_depth=None):
+    ok = True
+    for name, (rows, player) in POSITIONS.items():
+        depth = min(max_depth or PERFT_DEPTH[name], len(PERFT[name]))
+        for d in range(1, depth + 1):
+            start_time = time.time()
+            count = perft(parse_position(rows, player), d)
+            elapsed = time.time() - start_time
+            expected = PERFT[name][d - 1]
+            status = "ok" if count == expected else "FAILED (expected {})".format(expected)
+            print("{:<8} depth {:>2}: {:>10} nodes {:>8.2f} s  {}".format(name, d, count, elapsed, status))
+            ok = ok and count == expected
+    return ok
+
+# Returns True if applyMove/undoMove kept every field right
+def run_check(max_depth=None):
+    ok = True
+    for name, (rows, player) in POSITIONS.items():
+        depth = max_depth or BENCH_DEPTH[name]
+        start_time = time.time()
+        errors = check_incremental(parse_position(rows, player), depth)
+        elapsed = time.time() - start_time
+        print("{:<8} depth {:>2}: {:>8.2f} s  {}".format(
+            name, depth, elapsed, "ok" if errors == 0 else "{} FAILED".format(errors)))
+        ok = ok and errors == 0
+    return ok
+
+# the searches to benchmark, without the endgame solver so that they stay fixed-depth
+AGENTS = {
+    'minimax': lambda depth: agent.MinimaxAgent(depth),
+    'alphabeta': lambda depth: agent.AlphaBeta(depth, endgame_empties=0),
+    'pvs': lambda depth: agent.AlphaBeta(depth, endgame_empties=0, pvs=True),
+}
+
+def bench_search(player, state):
+    start_time = time.time()
+    move = player.choose_move(state)
+    elapsed = time.time() - start_time
+    return {
+        'move': "{},{}".format(move.x, move.y) if move != None else None,
+        'nodes': player.nodes,
+        'seconds': elapsed,
+        'nodes_per_second': player.nodes / elapsed if elapsed > 0 else 0.0,
+    }
+
+def run_bench(depth=None):
+    results = {}
+    for name, (rows, player) in POSITIONS.items():
+        d = depth or BENCH_DEPTH[name]
+        for agent_name, create_agent in AGENTS.items():
+            result = bench_search(create_agent(d), parse_position(rows, player))
+            # measured again with tracemalloc, which slows the search down
+            tracemalloc.start()
+            create_agent(d).choose_move(parse_position(rows, player))
+            result['peak_kb'] = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.stop()
+            key = "{}-d{}-{}".format(agent_name, d, name)
+            results[key] = result
+            print("{:<24} move {:<5} {:>9} nodes {:>8.3f} s {:>9.0f} nodes/s {:>9.0f} KB".format(
+                key, str(result['move']), result['nodes'], result['seconds'],
+                result['nodes_per_second'], result['peak_kb']))
+    return results
+
+def compare(results, baseline):
+    print("\nCompared with the baseline:")
+    for key, result in results.items():
+        if key not in baseline:
+            print("{:<24} not in baseline".format(key))
+            continue
+        base = baseline[key]
+        notes = []
+        if result['move'] != base['move']:
+            notes.append("move changed from " + str(base['move']))
+        if result['nodes'] != base['nodes']:
+            notes.append("nodes {:+.1%}".format(result['nodes'] / base['nodes'] - 1))
+        print("{:<24} time {:+7.1%}  memory {:+7.1%}  {}".format(
+            key, result['seconds'] / base['seconds'] - 1, result['peak_kb'] / base['peak_kb'] - 1,
+            ", ".join(notes)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Othello move generator tests and search benchmarks")
+    parser.add_argument('command', choices=['perft', 'check', 'bench'])
+    parser.add_argument('depth', type=int, nargs='?', default=None)
+    parser.add_argument('--save', help="write the benchmark results to this JSON file")
+    parser.add_argument('--baseline', help="compare the benchmark results with this JSON file")
+    args = parser.parse_args()
+
+    if args.command == 'perft':
+        sys.exit(0 if run_perft(args.depth) else 1)
+    if args.command == 'check':
+        sys.exit(0 if run_check(args.depth) else 1)
+
+    results = run_bench(args.depth)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
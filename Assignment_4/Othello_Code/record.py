@@ -0,0 +1,187 @@
+import argparse
+import json
+import struct
+import sys
+
+import evaluate
+import othello
+
+# Compact game records.
+# A game is stored as the sequence of its moves from the initial position, one byte per move
+# (i*boardSize+j, or PASS for a pass), instead of one State per ply. Boards too large for one
+# byte per square (16x16 and up) use two bytes per move. Positions are only rebuilt when they
+# are asked for, by replaying the moves.
+#
+# File format (all integers big-endian):
+#   header: b'OGR1'
+#   games:  boardSize (1 byte), number of moves (2 bytes), the moves
+# Games are read one at a time, so files with any number of games can be processed without
+# loading them into memory.
+#
+#   python3 record.py analyze <file> [--depth D] [--evaluator E]
+#                                 re-evaluate every position of every game and print, for
+#                                 each game, the result and the worst move of each player
+
+MAGIC = b'OGR1'
+GAME_HEADER = struct.Struct('>BH')
+
+def move_size(boardSize):
+    return 1 if boardSize * boardSize < 255 else 2
+
+def pass_code(boardSize):
+    return 255 if move_size(boardSize) == 1 else 65535
+
+class GameRecord:
+
+    def __init__(self, boardSize=8, moves=None):
+        self.boardSize = boardSize
+        self.moves = bytearray(moves or b'')
+
+    def __len__(self):
+        return len(self.moves) // move_size(self.boardSize)
+
+    # Adds a move (an OthelloMove, or None for a pass)
+    def append(self, move):
+        code = pass_code(self.boardSize) if move == None else move.x * self.boardSize + move.y
+        self.moves += code.to_bytes(move_size(self.boardSize), 'big')
+
+    # The square (i, j) played at 'ply', or None for a pass
+    def square(self, ply):
+        size = move_size(self.boardSize)
+        code = int.from_bytes(self.moves[ply * size:(ply + 1) * size], 'big')
+        if code == pass_code(self.boardSize):
+            return None
+        return divmod(code, self.boardSize)
+
+    # Yields the initial position and the position after every move, each one built from the
+    # previous one when it is needed
+    def replay(self):
+        state = othello.State(boardSize=self.boardSize)
+        yield state
+        for ply in range(len(self)):
+            square = self.square(ply)
+            if square == None:
+                state = state.passCloning()
+            else:
+                state = state.applyMoveCloning(othello.OthelloMove(state.nextPlayerToMove, square[0], square[1]))
+            yield state
+
+    # The position after 'ply' moves (the final position if None)
+    def state(self, ply=None):
+        if ply == None:
+            ply = len(self)
+        for index, state in enumerate(self.replay()):
+            if index == ply:
+                return state
+        raise IndexError("ply {} out of range".format(ply))
+
+    def encode(self):
+        return GAME_HEADER.pack(self.boardSize, len(self)) + bytes(self.moves)
+
+class RecordWriter:
+    # Writes games to a record file one at a time
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+
+    def write(self, record):
+        self.file.write(record.encode())
+
+    def close(self):
+        self.file.close()
+
+# Yields the games of a record file one at a time
+def read_records(path):
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a game record file".format(path))
+        while True:
+            header = f.read(GAME_HEADER.size)
+            if not header:
+                return
+            boardSize, length = GAME_HEADER.unpack(header)
+            moves = f.read(length * move_size(boardSize))
+            if len(moves) != length * move_size(boardSize):
+                raise ValueError("{} is truncated".format(path))
+            yield GameRecord(boardSize, moves)
+
+# Returns a function giving the value (for PLAYER1) of a position: the evaluator itself with
+# depth 0, or the value of an AlphaBeta search of that depth
+def position_evaluator(depth, evaluator=None):
+    evaluate_function = evaluate.get(evaluator)
+    if depth == 0:
+        return evaluate_function
+    # imported here because agent.py imports game.py, which imports this module
+    import agent
+    player = agent.AlphaBeta(depth, endgame_empties=0, evaluator=evaluator)
+
+    def search_value(state):
+        if state.game_over():
+            return evaluate_function(state)
+        if not state.generateMoves():
+            state = state.passCloning()
+        player.choose_move(state)
+        return player.best_value
+
+    return search_value
+
+# Replays a game evaluating every position. The loss of a move is how much the value dropped
+# for the player who made it.
+def analyze_game(record, evaluate_position):
+    values = []
+    movers = []
+    passes = 0
+    final_state = None
+    for state in record.replay():
+        values.append(evaluate_position(state))
+        movers.append(state.nextPlayerToMove)
+        final_state = state
+
+    worst = [None, None]
+    for ply in range(len(record)):
+        if record.square(ply) == None:
+            passes += 1
+            continue
+        mover = movers[ply]
+        loss = values[ply] - values[ply + 1]
+        if mover == othello.PLAYER2:
+            loss = -loss
+        if worst[mover] == None or loss > worst[mover]['loss']:
+            worst[mover] = {'ply': ply, 'square': list(record.square(ply)), 'loss': loss}
+
+    score = final_state.score()
+    return {
+        'plies': len(record),
+        'passes': passes,
+        'finished': final_state.game_over(),
+        'score': score,
+        'winner': final_state.winner(),
+        'worst_O': worst[othello.PLAYER1],
+        'worst_X': worst[othello.PLAYER2],
+    }
+
+def analyze(path, depth=0, evaluator=None, out=sys.stdout):
+    evaluate_position = position_evaluator(depth, evaluator)
+    totals = {'games': 0, 'O': 0, 'X': 0, 'DRAW': 0, 'plies': 0}
+    for index, record in enumerate(read_records(path)):
+        result = analyze_game(record, evaluate_position)
+        result['game'] = index
+        out.write(json.dumps(result) + "\n")
+        totals['games'] += 1
+        totals[result['winner']] += 1
+        totals['plies'] += result['plies']
+    return totals
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Othello game record tools")
+    parser.add_argument('command', choices=['analyze'])
+    parser.add_argument('file')
+    parser.add_argument('--depth', type=int, default=0, help="search depth of the evaluation (0: static evaluation)")
+    parser.add_argument('--evaluator', default=None, help="leaf evaluation, see evaluate.py")
+    args = parser.parse_args()
+
+    totals = analyze(args.file, args.depth, args.evaluator)
+    games = max(totals['games'], 1)
+    print("{} games: O won {}, X won {}, {} draws, {:.1f} plies per game".format(
+        totals['games'], totals['O'], totals['X'], totals['DRAW'], totals['plies'] / games), file=sys.stderr)
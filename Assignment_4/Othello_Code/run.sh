@@ -1,5 +1,9 @@
 #!/bin/sh
-if [ "$#" -eq 3 ]; then
+if [ "$#" -eq 5 ]; then
+    python3 main.py "$1" "$2" "$3" "$4" "$5"
+elif [ "$#" -eq 4 ]; then
+    python3 main.py "$1" "$2" "$3" "$4"
+elif [ "$#" -eq 3 ]; then
     python3 main.py "$1" "$2" "$3"
 elif [ "$#" -eq 2 ]; then
     python3 main.py "$1" "$2"
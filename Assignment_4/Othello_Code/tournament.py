@@ -0,0 +1,162 @@
+import argparse
+import concurrent.futures
+import itertools
+import json
+import math
+import random
+import sys
+
+import game
+import main
+import othello
+import record
+
+# Headless self-play tournament.
+# Every pair of agents plays N games on a process pool. Games are played in pairs from the
+# same (optionally random) opening with the colors swapped. Each finished game is written as
+# one JSON line; only the results are kept, and a summary with win/draw/loss counts, Elo
+# estimates and time and nodes per move is printed at the end.
+#
+# Agents are given as main.create_player arguments, optionally followed by an evaluator,
+# e.g. 'alphabeta:4', 'alphabeta:4:weighted', 'extra:200', 'mcts:500', 'random'. The number is
+# a depth for minimax and alphabeta and milliseconds per move for extra and mcts.
+
+def create_player(spec):
+    name, _, arg = spec.partition(':')
+    arg, _, evaluator = arg.partition(':')
+    player = main.create_player(name, int(arg) if arg else None, evaluator=evaluator or None)
+    if player == None or name == 'human':
+        raise ValueError("cannot use '{}' in a tournament".format(spec))
+    return player
+
+# Plays 'plies' random moves from the initial position, returns the position and its record
+def random_opening(plies, seed):
+    rng = random.Random(seed)
+    state = othello.State()
+    opening = record.GameRecord(state.boardSize)
+    for ply in range(plies):
+        if state.game_over():
+            break
+        moves = state.generateMoves()
+        move = rng.choice(moves) if moves else None
+        state = state.applyMoveCloning(move) if move != None else state.passCloning()
+        opening.append(move)
+    return state, opening
+
+def play_game(game_id, spec1, spec2, opening_plies, seed, ponder=0):
+    players = [create_player(spec1), create_player(spec2)]
+    initial_state, opening = random_opening(opening_plies, seed)
+    g = game.Game(initial_state, players[0], players[1], ponder, opening)
+    final_state = g.play(quiet=True)[-1]
+    for player in players:
+        if hasattr(player, 'close'):
+            player.close()
+    score = final_state.score()
+    result = {
+        'game': game_id,
+        'O': spec1,
+        'X': spec2,
+        'opening_seed': seed,
+        'score': score,
+        'winner': spec1 if score > 0 else spec2 if score < 0 else None,
+        'moves': [len(times) for times in g.move_times],
+        'time': [sum(times) for times in g.move_times],
+        'nodes': [sum(nodes) for nodes in g.move_nodes],
+    }
+    return result, g.record
+
+# Bradley-Terry ratings (minorization-maximization), converted to Elo with a mean of 0.
+# Each agent gets one virtual draw against every opponent so that ratings stay finite.
+def elo_ratings(agents, results):
+    points = {(a, b): 0.5 for a in agents for b in agents if a != b}
+    games = {(a, b): 1.0 for a in agents for b in agents if a != b}
+    for result in results:
+        a, b = result['O'], result['X']
+        if a == b:
+            continue
+        outcome = 1.0 if result['score'] > 0 else 0.0 if result['score'] < 0 else 0.5
+        points[a, b] += outcome
+        points[b, a] += 1 - outcome
+        games[a, b] += 1
+        games[b, a] += 1
+
+    strength = {a: 1.0 for a in agents}
+    for iteration in range(1000):
+        new_strength = {}
+        for a in agents:
+            wins = sum(points[a, b] for b in agents if b != a)
+            denominator = sum(games[a, b] / (strength[a] + strength[b]) for b in agents if b != a)
+            new_strength[a] = wins / denominator if denominator else strength[a]
+        change = max(abs(new_strength[a] - strength[a]) for a in agents)
+        strength = new_strength
+        if change < 1e-9:
+            break
+
+    ratings = {a: 400 * math.log10(strength[a]) for a in agents}
+    mean = sum(ratings.values()) / len(ratings)
+    return {a: ratings[a] - mean for a in agents}
+
+def summary(agents, results):
+    stats = {a: {'W': 0, 'D': 0, 'L': 0, 'moves': 0, 'time': 0.0, 'nodes': 0} for a in agents}
+    for result in results:
+        for color, spec in enumerate((result['O'], result['X'])):
+            score = result['score'] if color == othello.PLAYER1 else -result['score']
+            stats[spec]['W' if score > 0 else 'L' if score < 0 else 'D'] += 1
+            stats[spec]['moves'] += result['moves'][color]
+            stats[spec]['time'] += result['time'][color]
+            stats[spec]['nodes'] += result['nodes'][color]
+    ratings = elo_ratings(agents, results)
+
+    lines = ["{:<16} {:>5} {:>5} {:>5} {:>7} {:>10} {:>12}".format(
+        "agent", "W", "D", "L", "Elo", "ms/move", "nodes/move")]
+    for a in sorted(agents, key=lambda a: -ratings[a]):
+        s = stats[a]
+        moves = max(s['moves'], 1)
+        lines.append("{:<16} {:>5} {:>5} {:>5} {:>+7.0f} {:>10.1f} {:>12.0f}".format(
+            a, s['W'], s['D'], s['L'], ratings[a], 1000 * s['time'] / moves, s['nodes'] / moves))
+    return "\n".join(lines)
+
+# With 'records' (a record.RecordWriter), the moves of every game are saved too
+def run(agents, games, opening_plies=0, workers=None, seed=0, out=sys.stdout, ponder=0, records=None):
+    tasks = []
+    game_id = 0
+    for spec1, spec2 in itertools.combinations(agents, 2):
+        for pair in range((games + 1) // 2):
+            opening_seed = seed * 1000003 + game_id
+            tasks.append((game_id, spec1, spec2, opening_plies, opening_seed, ponder))
+            if 2 * pair + 1 < games:
+                tasks.append((game_id + 1, spec2, spec1, opening_plies, opening_seed, ponder))
+            game_id += 2
+
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(play_game, *task) for task in tasks]
+        for future in concurrent.futures.as_completed(futures):
+            result, game_record = future.result()
+            results.append(result)
+            out.write(json.dumps(result) + "\n")
+            if records != None:
+                records.write(game_record)
+            out.flush()
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Headless Othello tournament between agents")
+    parser.add_argument('agents', nargs='+', help="agents as name[:depth_or_time[:evaluator]], e.g. alphabeta:4 extra:200:weighted random")
+    parser.add_argument('-n', '--games', type=int, default=10, help="games per pairing")
+    parser.add_argument('--opening', type=int, default=0, help="number of random opening moves")
+    parser.add_argument('--workers', type=int, default=None, help="number of processes")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the random openings")
+    parser.add_argument('--ponder', type=int, default=0, help="processes per agent for thinking on the opponent's time")
+    parser.add_argument('--records', default=None, help="file for the game records (see record.py)")
+    parser.add_argument('--out', default=None, help="file for the JSON lines (default: standard output)")
+    args = parser.parse_args()
+
+    out = open(args.out, 'w') if args.out else sys.stdout
+    records = record.RecordWriter(args.records) if args.records else None
+    results = run(args.agents, args.games, args.opening, args.workers, args.seed, out, args.ponder, records)
+    if args.out:
+        out.close()
+    if records != None:
+        records.close()
+    print(summary(args.agents, results), file=sys.stderr)
@@ -1,7 +1,19 @@
+import concurrent.futures
+import hashlib
+import heapq
+import json
+import os
 import random
+import re
 import sys
+import time
+import tracemalloc
+
+import numpy as np
 
 DEFAULT_STATE = '       | ###  -| # #  +| # ####|       '
+# episodes between two checkpoints of the Q-table
+CHECKPOINT_EVERY = 100
 
 class Action:
 
@@ -69,8 +81,14 @@ class State:
 
 class Env:
 
+    # 'string' is the maze as a '|'-separated string, or any iterable of its rows
     def __init__(self, string):
-        self.grid = [list(line) for line in string.split('|')]
+        rows = string.split('|') if isinstance(string, str) else string
+        self.grid = [list(line) for line in rows]
+        # where the maze comes from (see load_env), saved with the Q-tables
+        self.source = string if isinstance(string, str) else None
+        if any(len(row) != len(self.grid[0]) for row in self.grid):
+            raise ValueError("all the rows of the maze must have the same length")
         self.x_size = len(self.grid[0])
         self.y_size = len(self.grid)
 
@@ -87,6 +105,36 @@ class Env:
     def row(self, y):
         return self.grid[y]
 
+    # Identifies the maze, e.g. to check that a saved Q-table belongs to it
+    def hash(self):
+        digest = hashlib.sha256()
+        for y in range(self.y_size):
+            digest.update((''.join(self.row(y)) + '|').encode())
+        return digest.hexdigest()
+
+    # The grid as a (y_size, x_size) array of characters
+    def cell_array(self):
+        return np.array(self.grid, dtype='U1').reshape(self.y_size, self.x_size)
+
+    # Boolean (y_size, x_size) array of the cells an agent can be in
+    def open_cells(self):
+        return np.isin(self.cell_array(), list(' +-'))
+
+    # Boolean (y_size, x_size, len(actions)) array: whether each action is legal in each cell
+    # (always False in walls)
+    def legal_mask(self, actions):
+        cells = self.open_cells()
+        mask = np.zeros((self.y_size, self.x_size, len(actions)), dtype=bool)
+        for a, action in enumerate(actions):
+            # the destination cell of every cell, where it is inside the grid
+            ys = slice(max(0, -action.dy), self.y_size - max(0, action.dy))
+            xs = slice(max(0, -action.dx), self.x_size - max(0, action.dx))
+            ys_to = slice(ys.start + action.dy, ys.stop + action.dy)
+            xs_to = slice(xs.start + action.dx, xs.stop + action.dx)
+            mask[ys, xs, a] = cells[ys_to, xs_to]
+        mask &= cells[:, :, np.newaxis]
+        return mask
+
     def random_state(self):
         x = random.randrange(0, self.x_size)
         y = random.randrange(0, self.y_size)
@@ -95,29 +143,141 @@ class Env:
             y = random.randrange(0, self.y_size)
         return State(self, x, y)
 
-class QTable:
+class Transitions:
+    # The dynamics of the maze, precomputed once for every cell so that a training step is a few
+    # array lookups. Cells are numbered y * x_size + x; for every cell:
+    #   legal[c, a]         whether action a is legal
+    #   legal_count[c]      number of legal actions
+    #   legal_ids[c, k]     id of the k-th legal action (k < legal_count[c])
+    #   next_cell[c, a]     cell reached with action a (c itself if a is illegal)
+    #   reward[c]           reward for reaching c: +10, -10 or 0
+    #   terminal[c]         whether an episode ends in c
+    # and start_cells lists the empty cells with at least one legal action.
 
     def __init__(self, env, actions):
+        self.x_size = env.x_size
+        self.y_size = env.y_size
+        legal = env.legal_mask(actions).reshape(-1, len(actions))
+        cells = np.arange(env.x_size * env.y_size).reshape(env.y_size, env.x_size)
+
+        self.next_cell = np.empty(legal.shape, dtype=np.int32 if len(legal) < 2 ** 31 else np.int64)
+        for a, action in enumerate(actions):
+            # wrapping around is harmless: the actions that would wrap are illegal
+            moved = np.roll(cells, (-action.dy, -action.dx), axis=(0, 1)).ravel()
+            self.next_cell[:, a] = np.where(legal[:, a], moved, cells.ravel())
+
+        self.legal = legal
+        self.legal_count = legal.sum(axis=1, dtype=np.int8)
+        # stable sort: the legal action ids first, in the order of 'actions'
+        self.legal_ids = np.argsort(~legal, axis=1, kind='stable').astype(np.int8)
+
+        grid = env.cell_array().ravel()
+        self.reward = np.where(grid == '+', 10, np.where(grid == '-', -10, 0)).astype(np.int8)
+        self.terminal = self.reward != 0
+        self.start_cells = np.flatnonzero((grid == ' ') & (self.legal_count > 0))
+
+class Convergence:
+    # Per-episode statistics of a training run (the largest change of a Q-value and the length
+    # of every episode, and every 'eval_every' episodes the greedy success rate) and the early
+    # stopping test: every 'check_every' episodes, the Bellman residual of the whole table
+    # (the largest change one Bellman update of every entry would make, see
+    # QTable.bellman_backup) is measured, and the table has converged when it is at most
+    # 'tolerance'. Unlike the changes made by the episodes, the residual also covers the
+    # entries the episodes rarely visit: the table is then within tolerance / (1 - gamma)
+    # of the one value iteration converges to.
+
+    def __init__(self, tolerance=1e-3, check_every=100, eval_every=0):
+        self.tolerance = tolerance
+        self.check_every = check_every
+        self.eval_every = eval_every
+        self.max_deltas = []
+        self.lengths = []
+        # (episode, greedy success rate) pairs
+        self.success_rates = []
+        # (episode, Bellman residual) pairs
+        self.residuals = []
+
+    def record(self, qtable, length, max_delta, gamma=.90):
+        self.max_deltas.append(max_delta)
+        self.lengths.append(length)
+        if len(self.lengths) % self.check_every == 0:
+            q = qtable.q_table.reshape(-1, len(qtable.actions))
+            residual = float(np.abs(qtable.bellman_backup(gamma) - q).max())
+            self.residuals.append((len(self.lengths), residual))
+        if self.eval_every and len(self.lengths) % self.eval_every == 0:
+            self.success_rates.append((len(self.lengths), qtable.greedy_success_rate()))
+
+    def converged(self):
+        return bool(self.residuals) and self.residuals[-1][1] <= self.tolerance
+
+    # Episodes until the check that found the table converged, or None if the training has
+    # not converged. The table may have converged up to check_every - 1 episodes earlier.
+    def episodes_to_convergence(self):
+        return self.residuals[-1][0] if self.converged() else None
+
+class QTable:
+    # The Q-values are kept in a (y_size, x_size, len(actions)) NumPy array, indexed by cell and
+    # by the position of the action in 'actions'. Cells that are walls keep a value of 0.
+    # 'dtype' can be np.float32 to halve the memory used by very large mazes.
+    # An existing array (e.g. a memory-mapped one, see load_qtable) can be given as 'q_table'.
+
+    def __init__(self, env, actions, dtype=np.float64, q_table=None):
         self.env = env
         self.actions = actions
-        self.q_table = {}
-        # Initialize Q-values to 0 for all state-action pairs
-        for y in range(env.y_size):
-            for x in range(env.x_size):
-                if env.get(x, y) in ' +-':  # Only for valid states
-                    for action in actions:
-                        self.set_q(State(env, x, y), action, 0.0)
+        # integer id of every action, its index in the last dimension of the array
+        self.action_ids = {action.name: i for i, action in enumerate(actions)}
+        if q_table is None:
+            # Initialize Q-values to 0 for all state-action pairs
+            q_table = np.zeros((env.y_size, env.x_size, len(actions)), dtype=dtype)
+        self.q_table = q_table
+        # number of training episodes the table has seen
+        self.episodes = 0
+        # built on the first headless training
+        self.transitions = None
+
+    def get_transitions(self):
+        if self.transitions is None:
+            self.transitions = Transitions(self.env, self.actions)
+        return self.transitions
 
     def get_q(self, state, action):
+        return float(self.q_table[state.y, state.x, self.action_ids[action.name]])
 
-        key = (state.x, state.y, action.name)
-        return self.q_table.get(key, 0.0)
+    # The Q-values of all the actions in 'state', a view on the table
     def get_q_row(self, state):
-        return [self.get_q(state, action) for action in self.actions]
+        return self.q_table[state.y, state.x]
 
     def set_q(self, state, action, val):
-        key = (state.x, state.y, action.name)
-        self.q_table[key] = val
+        self.q_table[state.y, state.x, self.action_ids[action.name]] = val
+
+    # (y_size, x_size) array of the best Q-value of every cell
+    def max_q(self):
+        return self.q_table.max(axis=2)
+
+    # (y_size, x_size) array of the id of the best action of every cell
+    def argmax_q(self):
+        return self.q_table.argmax(axis=2)
+
+    # Greedy policy: (y_size, x_size) array of the id of the best legal action of every cell,
+    # -1 for the cells without legal actions
+    def greedy_policy(self):
+        legal = self.get_transitions().legal.reshape(self.q_table.shape)
+        policy = np.where(legal, self.q_table, -np.inf).argmax(axis=2)
+        policy[~legal.any(axis=2)] = -1
+        return policy
+
+    # Fraction of the start cells from which following the greedy policy reaches a '+' cell
+    def greedy_success_rate(self):
+        model = self.get_transitions()
+        policy = self.greedy_policy().ravel()
+        cells = np.arange(len(policy))
+        # the cell reached with one step of the policy; the episodes stop in terminal cells
+        follow = np.where((policy >= 0) & ~model.terminal, model.next_cell[cells, np.maximum(policy, 0)], cells)
+        # the cell reached after 2**k steps. A path that doesn't end in a terminal cell within
+        # len(cells) steps is in a loop and never will.
+        for k in range(len(cells).bit_length()):
+            follow = follow[follow]
+        return float((model.reward[follow[model.start_cells]] > 0).mean())
 
     def learn_episode(self, alpha=.10, gamma=.90):
         # with the given alpha and gamma values,
@@ -131,6 +291,9 @@ class QTable:
         # 𝑅      is the        reward        after        performing        the        action        𝐴 in state        𝑆 — in other
         # words, the        reward        for the agent in state 𝑆′.The default values of 𝛼 and 𝛾 are provided in the code and can be left as is.To compute the final max part of the equation, note that it is essentially the maximum of the row of the Q-table (which can be gotten with get_q_row()) for state 𝑆′.
         #
+        # returns the number of steps and the largest change of a Q-value
+        steps = 0
+        max_delta = 0.0
         state = self.env.random_state()
         while not state.at_end():
             print(state)
@@ -146,13 +309,228 @@ class QTable:
 
             # Update the Q-table
             self.set_q(prev_state, action, new_q)
+            steps += 1
+            max_delta = max(max_delta, abs(new_q - current_q))
 
             # Print the final state
         print(state)
+        return steps, max_delta
 
-    def learn(self, episodes, alpha=.10, gamma=.90):
+    # With 'checkpoint', the table is saved to that file every 'checkpoint_every' episodes
+    # and at the end. With 'convergence' (a Convergence), the episodes are recorded in it and
+    # the training stops early once the table has converged.
+    def learn(self, episodes, alpha=.10, gamma=.90, checkpoint=None, checkpoint_every=CHECKPOINT_EVERY,
+              convergence=None):
         for i in range(episodes):
-            self.learn_episode(alpha, gamma)
+            steps, max_delta = self.learn_episode(alpha, gamma)
+            self.episodes += 1
+            if checkpoint and (i + 1) % checkpoint_every == 0:
+                self.save(checkpoint, alpha=alpha, gamma=gamma)
+            if convergence != None:
+                convergence.record(self, steps, max_delta, gamma)
+                if convergence.converged():
+                    break
+        if checkpoint:
+            self.save(checkpoint, alpha=alpha, gamma=gamma)
+
+    # Headless training: the same episodes and update rule as learn_episode, without printing
+    # anything and with the transitions looked up in precomputed tables.
+    # With 'log_every', a progress line is printed every 'log_every' episodes, and
+    # 'checkpoint' and 'convergence' work like in learn.
+    # Returns a summary of the training.
+    def train(self, episodes, alpha=.10, gamma=.90, log_every=0, checkpoint=None,
+              checkpoint_every=CHECKPOINT_EVERY, convergence=None):
+        model = self.get_transitions()
+        q = self.q_table.reshape(-1, len(self.actions))
+        next_cell = model.next_cell
+        legal_ids = model.legal_ids
+        legal_count = model.legal_count
+        reward = model.reward
+        terminal = model.terminal
+        start_cells = model.start_cells
+
+        start_time = time.time()
+        steps = 0
+        completed = 0
+        for episode in range(episodes):
+            cell = start_cells[random.randrange(len(start_cells))]
+            length = 0
+            max_delta = 0.0
+            while not terminal[cell]:
+                action = legal_ids[cell, random.randrange(legal_count[cell])]
+                next_state = next_cell[cell, action]
+                max_next_q = q[next_state].max() if not terminal[next_state] else 0
+                current_q = q[cell, action]
+                new_q = (1 - alpha) * current_q + alpha * (reward[next_state] + gamma * max_next_q)
+                q[cell, action] = new_q
+                max_delta = max(max_delta, abs(new_q - current_q))
+                cell = next_state
+                length += 1
+            steps += length
+            completed += 1
+            self.episodes += 1
+            if checkpoint and (episode + 1) % checkpoint_every == 0:
+                self.save(checkpoint, alpha=alpha, gamma=gamma)
+            if log_every and (episode + 1) % log_every == 0:
+                elapsed = time.time() - start_time
+                print("episode {}: {} steps, {:.0f} steps/s".format(
+                    episode + 1, steps, steps / elapsed if elapsed > 0 else 0.0))
+            if convergence != None:
+                convergence.record(self, length, float(max_delta), gamma)
+                if convergence.converged():
+                    break
+        if checkpoint:
+            self.save(checkpoint, alpha=alpha, gamma=gamma)
+
+        elapsed = time.time() - start_time
+        return {'episodes': completed, 'steps': steps, 'seconds': elapsed,
+                'steps_per_second': steps / elapsed if elapsed > 0 else 0.0}
+
+    # Batched headless training: 'agents' independent agents move in the maze at the same time,
+    # and each step samples the actions, applies the transitions and updates the table for all
+    # of them with array operations. An agent that reaches a '+' or '-' cell starts a new
+    # episode from a random cell. Stops after 'episodes' episodes have been completed.
+    # The update rule is the one of learn_episode; when several agents update the same state
+    # and action in the same step, only one of the updates is kept.
+    def train_batch(self, episodes, agents=64, alpha=.10, gamma=.90, log_every=0, seed=None):
+        model = self.get_transitions()
+        q = self.q_table.reshape(-1, len(self.actions))
+        rng = np.random.default_rng(seed)
+        start_cells = model.start_cells
+
+        start_time = time.time()
+        cells = rng.choice(start_cells, agents)
+        steps = 0
+        completed = 0
+        next_log = log_every
+        while completed < episodes:
+            # a uniformly random legal action for every agent
+            k = (rng.random(agents) * model.legal_count[cells]).astype(np.int64)
+            actions = model.legal_ids[cells, k]
+            next_cells = model.next_cell[cells, actions]
+            done = model.terminal[next_cells]
+            max_next_q = np.where(done, 0, q[next_cells].max(axis=1))
+            q[cells, actions] = (1 - alpha) * q[cells, actions] + alpha * (model.reward[next_cells] + gamma * max_next_q)
+
+            steps += agents
+            completed += int(done.sum())
+            cells = next_cells
+            cells[done] = rng.choice(start_cells, int(done.sum()))
+            if log_every and completed >= next_log:
+                elapsed = time.time() - start_time
+                print("episode {}: {} steps, {:.0f} steps/s".format(
+                    completed, steps, steps / elapsed if elapsed > 0 else 0.0))
+                next_log += log_every
+        self.episodes += completed
+
+        elapsed = time.time() - start_time
+        return {'episodes': completed, 'steps': steps, 'seconds': elapsed,
+                'steps_per_second': steps / elapsed if elapsed > 0 else 0.0}
+
+    # Model-based planning. The dynamics are known, so instead of sampling episodes the table can
+    # be computed directly. Both planners converge to the table that learn_episode converges
+    # to: Q(S, A) = R + gamma * max(row of S'), with max = 0 when S' is a '+' or '-' cell, for
+    # the legal actions; the other entries stay 0. They stop when no entry would change by
+    # more than 'threshold', and return the number of iterations, the time and the remaining
+    # largest change.
+
+    # The table that one Bellman update of every entry gives from the current one
+    def bellman_backup(self, gamma=.90):
+        model = self.get_transitions()
+        q = self.q_table.reshape(-1, len(self.actions))
+        values = np.where(model.terminal, 0, q.max(axis=1))
+        update = model.legal & ~model.terminal[:, np.newaxis]
+        return np.where(update, model.reward[model.next_cell] + gamma * values[model.next_cell], 0)
+
+    # Value iteration: every iteration updates the whole table at once from the previous one
+    def value_iteration(self, gamma=.90, threshold=1e-6, max_iterations=100000):
+        q = self.q_table.reshape(-1, len(self.actions))
+        start_time = time.time()
+        iterations = 0
+        delta = float('inf')
+        while delta > threshold and iterations < max_iterations:
+            new_q = self.bellman_backup(gamma)
+            delta = float(np.abs(new_q - q).max())
+            q[:] = new_q
+            iterations += 1
+        return {'iterations': iterations, 'seconds': time.time() - start_time, 'delta': delta}
+
+    # Prioritized sweeping: the cells are updated one at a time, the cell whose values would
+    # change the most first. When the value of a cell changes, the cells leading to it are
+    # queued with their new Bellman error, so only the cells affected by a change are visited.
+    # An iteration is the update of one cell.
+    def prioritized_sweeping(self, gamma=.90, threshold=1e-6):
+        model = self.get_transitions()
+        q = self.q_table.reshape(-1, len(self.actions))
+        next_cell = model.next_cell
+        legal_ids = model.legal_ids
+        legal_count = model.legal_count
+        reward = model.reward
+        terminal = model.terminal
+        # offset of the cell reached with every action
+        offsets = [action.dy * model.x_size + action.dx for action in self.actions]
+
+        def value(cell):
+            return 0.0 if terminal[cell] else float(q[cell].max())
+
+        def targets(cell):
+            return [(a, reward[next_cell[cell, a]] + gamma * value(next_cell[cell, a]))
+                    for a in legal_ids[cell, :legal_count[cell]]]
+
+        def error(cell):
+            return max((abs(target - q[cell, a]) for a, target in targets(cell)), default=0.0)
+
+        start_time = time.time()
+        errors = np.abs(self.bellman_backup(gamma) - q).max(axis=1)
+        queue = [(-errors[cell], cell) for cell in np.flatnonzero(errors > threshold)]
+        heapq.heapify(queue)
+        # current priority of every queued cell, to skip the outdated entries of the queue
+        priority = {cell: -e for e, cell in queue}
+
+        iterations = 0
+        while queue:
+            e, cell = heapq.heappop(queue)
+            if priority.get(cell) != -e:
+                continue
+            del priority[cell]
+            old_value = value(cell)
+            for a, target in targets(cell):
+                q[cell, a] = target
+            iterations += 1
+            if value(cell) == old_value:
+                continue
+            for a, offset in enumerate(offsets):
+                previous = cell - offset
+                if (0 <= previous < len(q) and previous != cell and next_cell[previous, a] == cell
+                        and not terminal[previous]):
+                    e = error(previous)
+                    if e > threshold and e > priority.get(previous, 0.0):
+                        priority[previous] = e
+                        heapq.heappush(queue, (-e, previous))
+
+        delta = float(np.abs(self.bellman_backup(gamma) - q).max())
+        return {'iterations': iterations, 'seconds': time.time() - start_time, 'delta': delta}
+
+    # Saves the table to 'path' (a .npy file) and its metadata to 'path'.json: the hash of the
+    # maze, the actions, the number of episodes trained, and 'metadata' (e.g. alpha and gamma).
+    # Each file is written under a temporary name and then renamed, so that an interrupted
+    # checkpoint never leaves a broken file, and a process that has the previous file
+    # memory-mapped keeps reading it unchanged.
+    def save(self, path, **metadata):
+        metadata.update({
+            'maze': self.env.source,
+            'maze_hash': self.env.hash(),
+            'x_size': self.env.x_size,
+            'y_size': self.env.y_size,
+            'actions': [action.name for action in self.actions],
+            'episodes': self.episodes,
+        })
+        with open(path + '.tmp', 'wb') as f:
+            np.save(f, self.q_table)
+        os.replace(path + '.tmp', path)
+        with open(path + '.json.tmp', 'w') as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(path + '.json.tmp', path + '.json')
 
     def __str__(self):
         result = ""
@@ -164,19 +542,13 @@ class QTable:
 
             # Create a grid of Q-values for this action
             action_grid = []
-            for y in range(self.env.y_size):
+            for q_row in self.q_table[:, :, action_idx]:
                 row = []
-                for x in range(self.env.x_size):
-                    cell = self.env.get(x, y)
-                    if cell in ' +-':  # Only valid locations
-                        state = State(self.env, x, y)
-                        q_val = self.get_q(state, action)
-                        if q_val == 0.0:  # Check if Q-value is zero
-                            row.append("----")
-                        else:
-                            row.append(f"{q_val:.2f}")
-                    else:
+                for q_val in q_row:
+                    if q_val == 0.0:  # zero, or not a valid location
                         row.append("----")
+                    else:
+                        row.append(f"{q_val:.2f}")
                 action_grid.append(row)
 
             # Print the grid
@@ -185,11 +557,241 @@ class QTable:
 
         return result
 
+# Loads a table saved with QTable.save, for the maze 'env'. Returns the table and its metadata.
+# The file is memory-mapped, so even a huge table opens at once and only the pages that are
+# used are read. mmap_mode is the one of np.load: 'r' (read-only, the pages are shared by all
+# the processes that map the file), 'c' (copy-on-write: the table can be trained, the file
+# stays unchanged), 'r+' (trained in place) or None (read into memory).
+def load_qtable(env, path, mmap_mode='r'):
+    with open(path + '.json') as f:
+        metadata = json.load(f)
+    if metadata['maze_hash'] != env.hash():
+        raise ValueError("{} was saved for another maze".format(path))
+    actions = [action for name in metadata['actions'] for action in ACTIONS if action.name == name]
+    # a plain array on the same memory: indexing a np.memmap is slower
+    qt = QTable(env, actions, q_table=np.asarray(np.load(path, mmap_mode=mmap_mode)))
+    qt.episodes = metadata['episodes']
+    return qt, metadata
+
+# Hyperparameter sweep: every worker process trains tables for the same maze, which it
+# receives once when it starts
+_sweep_env = None
+
+def _init_sweep_worker(env):
+    global _sweep_env
+    _sweep_env = env
+
+# Trains a new table until it converges or 'episodes' episodes have been played
+def _sweep_run(alpha, gamma, episodes, tolerance, check_every, seed):
+    random.seed(seed)
+    qt = QTable(_sweep_env, ACTIONS)
+    convergence = Convergence(tolerance, check_every)
+    summary = qt.train(episodes, alpha, gamma, convergence=convergence)
+    return {
+        'alpha': alpha,
+        'gamma': gamma,
+        'max_episodes': episodes,
+        'converged': convergence.converged(),
+        'episodes_to_convergence': convergence.episodes_to_convergence(),
+        'bellman_residual': convergence.residuals[-1][1] if convergence.residuals else None,
+        'episodes': summary['episodes'],
+        'steps': summary['steps'],
+        'seconds': summary['seconds'],
+        'mean_episode_length': summary['steps'] / max(summary['episodes'], 1),
+        'greedy_success_rate': qt.greedy_success_rate(),
+    }
+
+# Trains a table for every combination of 'alphas', 'gammas' and 'episodes' on a pool of
+# 'workers' processes and returns a report with the time to convergence of each one
+def sweep(env, alphas, gammas, episodes, tolerance=1e-3, check_every=100, workers=None, seed=0):
+    configurations = [(alpha, gamma, count) for alpha in alphas for gamma in gammas for count in episodes]
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_sweep_worker, initargs=(env,)) as pool:
+        futures = [pool.submit(_sweep_run, alpha, gamma, count, tolerance, check_every, seed + i)
+                   for i, (alpha, gamma, count) in enumerate(configurations)]
+        results = [future.result() for future in futures]
+    return {
+        'maze': env.source,
+        'maze_hash': env.hash(),
+        'tolerance': tolerance,
+        'check_every': check_every,
+        'convergence_test': "Bellman residual of the whole table <= tolerance, measured every check_every "
+                            "episodes; episodes_to_convergence is the first check that passed, so the "
+                            "table may have converged up to check_every - 1 episodes earlier",
+        'results': results,
+    }
+
+# Maze files: one row of the maze per line, with the same characters as the command-line
+# string (' ' empty, '#' wall, '+' and '-' rewards). The file is read one line at a time.
+def load_maze(path):
+    with open(path) as f:
+        return Env(line.rstrip('\n') for line in f if line.rstrip('\n'))
+
+def save_maze(env, path):
+    with open(path, 'w') as f:
+        for y in range(env.y_size):
+            f.write(''.join(env.row(y)) + '\n')
+
+# Generates a random maze: a perfect maze carved by a randomized depth-first search on the
+# cells with even coordinates, with a fraction 'loops' of the remaining inner walls removed so
+# that there is more than one path, 'rewards' '+' cells placed on random empty cells and
+# 'penalties' '-' cells placed on random dead ends. An episode ends on a '-' cell, so a '-' in
+# a corridor would cut off the part of the maze behind it; a dead end is on no path.
+def generate_maze(x_size, y_size, rewards=1, penalties=1, loops=0.1, seed=None):
+    rng = random.Random(seed)
+    grid = [['#'] * x_size for y in range(y_size)]
+    columns = (x_size + 1) // 2
+    rows = (y_size + 1) // 2
+    visited = bytearray(columns * rows)
+    visited[0] = 1
+    grid[0][0] = ' '
+    stack = [(0, 0)]
+    while stack:
+        cx, cy = stack[-1]
+        neighbors = [(cx + dx, cy + dy) for dx, dy in ((0, -1), (1, 0), (0, 1), (-1, 0))
+                     if 0 <= cx + dx < columns and 0 <= cy + dy < rows
+                     and not visited[(cy + dy) * columns + cx + dx]]
+        if not neighbors:
+            stack.pop()
+            continue
+        nx, ny = rng.choice(neighbors)
+        visited[ny * columns + nx] = 1
+        grid[2 * ny][2 * nx] = ' '
+        grid[cy + ny][cx + nx] = ' '  # the wall between the two cells
+        stack.append((nx, ny))
+
+    cells = np.array(grid, dtype='U1').reshape(y_size, x_size)
+    array_rng = np.random.default_rng(seed)
+    ys, xs = np.indices(cells.shape)
+    # the walls between two cells of the maze
+    inner = (cells == '#') & (((ys % 2 == 0) & (xs % 2 == 1) & (xs + 1 < x_size)) |
+                              ((ys % 2 == 1) & (xs % 2 == 0) & (ys + 1 < y_size)))
+    cells[inner & (array_rng.random(cells.shape) < loops)] = ' '
+    empty = cells == ' '
+    cells.ravel()[array_rng.choice(np.flatnonzero(empty), rewards, replace=False)] = '+'
+    # the empty cells with a single open neighbor
+    padded = np.pad(cells != '#', 1)
+    neighbors = (padded[:-2, 1:-1].astype(np.int8) + padded[2:, 1:-1] + padded[1:-1, :-2] + padded[1:-1, 2:])
+    dead_ends = np.flatnonzero((cells == ' ') & (neighbors == 1))
+    if len(dead_ends) < penalties:
+        raise ValueError("the maze has only {} dead ends for {} penalties".format(len(dead_ends), penalties))
+    cells.ravel()[array_rng.choice(dead_ends, penalties, replace=False)] = '-'
+    return Env(''.join(row) for row in cells)
+
+# A maze given on the command line: a maze file, a size like 200x100 (a generated maze), or
+# the maze itself as a '|'-separated string
+def load_env(arg):
+    if os.path.isfile(arg):
+        env = load_maze(arg)
+    elif re.fullmatch(r'(\d+)x(\d+)', arg):
+        x_size, y_size = arg.split('x')
+        env = generate_maze(int(x_size), int(y_size), seed=0)
+    else:
+        return Env(arg)
+    env.source = arg
+    return env
+
+LEARNERS = ['train', 'train_batch', 'value_iteration', 'prioritized_sweeping']
+
+# Runs every learner on 'env'. The sample-based learners are trained 'chunk' episodes at a time
+# until their table is within 'tolerance' of the one value iteration converges to, or until
+# 'max_episodes' or 'max_seconds'. The memory peak is measured in a second, shorter run with tracemalloc,
+# which slows everything down.
+def bench(env, max_episodes=10000, tolerance=0.01, chunk=100, max_seconds=60):
+    reference = QTable(env, ACTIONS)
+    reference.value_iteration()
+    print("{:<22} {:>12} {:>12} {:>10} {:>10}".format("learner", "steps/s", "episodes", "seconds", "peak MB"))
+    results = {}
+    for learner in LEARNERS:
+        qt = QTable(env, ACTIONS)
+        start_time = time.time()
+        if learner in ('value_iteration', 'prioritized_sweeping'):
+            summary = getattr(qt, learner)()
+            rate = "{} it".format(summary['iterations'])
+            episodes = None
+        else:
+            steps = 0
+            episodes = 0
+            converged = False
+            while not converged and episodes < max_episodes and time.time() - start_time < max_seconds:
+                summary = getattr(qt, learner)(chunk)
+                episodes += summary['episodes']
+                steps += summary['steps']
+                converged = np.abs(qt.q_table - reference.q_table).max() < tolerance
+            if not converged:
+                episodes = None
+            rate = "{:.0f}".format(steps / max(time.time() - start_time, 1e-9))
+        elapsed = time.time() - start_time
+
+        tracemalloc.start()
+        qt = QTable(env, ACTIONS)
+        if learner in ('value_iteration', 'prioritized_sweeping'):
+            getattr(qt, learner)()
+        else:
+            getattr(qt, learner)(chunk)
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+
+        results[learner] = {'rate': rate, 'episodes': episodes, 'seconds': elapsed, 'peak_mb': peak}
+        print("{:<22} {:>12} {:>12} {:>10.2f} {:>10.2f}".format(
+            learner, rate, str(episodes if episodes != None else "-"), elapsed, peak))
+    return results
+
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
+    # the maze argument can be a '|'-separated string, a maze file or a size like 500x500
+    if len(sys.argv) > 2 and sys.argv[1] == 'resume':
+        # continues the training of a checkpoint with the same maze and hyperparameters:
+        # python3 qlearn.py resume <checkpoint> [episodes] [maze]
+        with open(sys.argv[2] + '.json') as f:
+            metadata = json.load(f)
+        env = load_env(sys.argv[4] if len(sys.argv) > 4 else metadata['maze'])
+        qt, metadata = load_qtable(env, sys.argv[2], mmap_mode='c')
+        summary = qt.train(int(sys.argv[3]) if len(sys.argv) > 3 else 100, metadata['alpha'], metadata['gamma'],
+                           checkpoint=sys.argv[2])
+        print(qt)
+        print("{} episodes in total, {} more steps in {:.3f} s".format(qt.episodes, summary['steps'], summary['seconds']))
+    elif len(sys.argv) > 1 and sys.argv[1] == 'generate':
+        # python3 qlearn.py generate <file> <width> <height> [rewards] [penalties] [seed]
+        args = [int(arg) for arg in sys.argv[3:8]]
+        save_maze(generate_maze(*args[:4], seed=args[4] if len(args) > 4 else None), sys.argv[2])
+    elif len(sys.argv) > 1:
         cmd = sys.argv[1]
-        env = Env(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_STATE)
+        env = load_env(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_STATE)
         if cmd == 'learn':
+            # python3 qlearn.py learn [maze] [checkpoint]
+            qt = QTable(env, ACTIONS)
+            qt.learn(100, checkpoint=sys.argv[3] if len(sys.argv) > 3 else None)
+            print(qt)
+        elif cmd == 'train':
+            # headless: python3 qlearn.py train [maze] [episodes] [checkpoint]
+            qt = QTable(env, ACTIONS)
+            summary = qt.train(int(sys.argv[3]) if len(sys.argv) > 3 else 100,
+                               checkpoint=sys.argv[4] if len(sys.argv) > 4 else None)
+            print(qt)
+            print("{episodes} episodes, {steps} steps in {seconds:.3f} s ({steps_per_second:.0f} steps/s)".format(**summary))
+        elif cmd in ('value_iteration', 'prioritized_sweeping'):
+            # planning with the known dynamics: python3 qlearn.py value_iteration [maze] [threshold]
+            qt = QTable(env, ACTIONS)
+            summary = getattr(qt, cmd)(threshold=float(sys.argv[3]) if len(sys.argv) > 3 else 1e-6)
+            print(qt)
+            print("converged in {iterations} iterations, {seconds:.3f} s (largest change left {delta:.2e})".format(**summary))
+        elif cmd == 'train_batch':
+            # headless, many agents at once: python3 qlearn.py train_batch [maze] [episodes]
             qt = QTable(env, ACTIONS)
-            qt.learn(100)
+            summary = qt.train_batch(int(sys.argv[3]) if len(sys.argv) > 3 else 100)
             print(qt)
+            print("{episodes} episodes, {steps} steps in {seconds:.3f} s ({steps_per_second:.0f} steps/s)".format(**summary))
+        elif cmd == 'sweep':
+            # python3 qlearn.py sweep <maze> <alphas> <gammas> <episodes> [report] [workers]
+            # with comma-separated lists, e.g. sweep 50x50 0.1,0.5 0.8,0.9 1000,5000 report.json
+            report = sweep(env, [float(a) for a in sys.argv[3].split(',')],
+                           [float(g) for g in sys.argv[4].split(',')],
+                           [int(e) for e in sys.argv[5].split(',')],
+                           workers=int(sys.argv[7]) if len(sys.argv) > 7 else None)
+            if len(sys.argv) > 6:
+                with open(sys.argv[6], 'w') as f:
+                    json.dump(report, f, indent=2)
+            else:
+                print(json.dumps(report, indent=2))
+        elif cmd == 'bench':
+            # python3 qlearn.py bench [maze] [max episodes]
+            bench(env, int(sys.argv[3]) if len(sys.argv) > 3 else 10000)